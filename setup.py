@@ -14,8 +14,6 @@ setup(
         'altair',
         'branca',
         'bs4',
-        'geopy',
-        'gpxpy',
         'folium',
         'matplotlib',
         'netCDF4',
@@ -25,8 +23,7 @@ setup(
         'requests',
         'scipy',
         'tikzplotlib',
-        'timezonefinder',
-        'tzwhere'
+        'timezonefinder'
       ],
     entry_points={
         'console_scripts': [
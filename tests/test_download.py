@@ -0,0 +1,88 @@
+import ftplib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ttm.download import Downloader
+
+CONTENT = bytes(range(256)) * 1000
+
+class Handler(BaseHTTPRequestHandler):
+    """Stand-in for the NOAA HTTP server with range requests, records the requests"""
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append((self.path, self.headers.get('Range')))
+        if self.path != '/data.bin':
+            self.send_error(404)
+            return
+
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(CONTENT) - 1, len(CONTENT)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(CONTENT) - start))
+        self.end_headers()
+        self.wfile.write(CONTENT[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_resume(server, tmp_path):
+    targetpath = tmp_path / 'data.bin'
+    with open(str(targetpath) + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+
+    with Downloader(backoff = 0) as downloader:
+        assert downloader.fetch(server + '/data.bin', str(targetpath))
+
+    assert targetpath.read_bytes() == CONTENT
+    assert Handler.requests == [('/data.bin', 'bytes=1000-')]
+    assert downloader.downloaded_bytes == len(CONTENT) - 1000
+
+def test_client_error_not_retried(server, tmp_path):
+    with Downloader(backoff = 0) as downloader:
+        assert not downloader.fetch(server + '/missing.bin', str(tmp_path / 'missing.bin'))
+
+    assert len(Handler.requests) == 1
+    assert downloader.failed_files == 1
+    assert not (tmp_path / 'missing.bin').exists()
+
+class FakeFTP:
+    def retrbinary(self, command, callback, blocksize = 8192, rest = None):
+        callback(CONTENT)
+
+    def close(self):
+        pass
+
+def test_login_failure(monkeypatch, tmp_path):
+    logins = []
+    def connect(url):
+        logins.append(url.netloc)
+        if len(logins) == 1:
+            raise ftplib.error_perm('530 Login incorrect.')
+        return FakeFTP()
+
+    with Downloader(backoff = 0) as downloader:
+        monkeypatch.setattr(downloader, '_connect', connect)
+        assert not downloader.fetch('ftp://ftp.example.org/data.bin', str(tmp_path / 'first.bin'))
+
+        # Failed login leaves no session in the pool, the next download connects again
+        assert downloader.fetch('ftp://ftp.example.org/data.bin', str(tmp_path / 'second.bin'))
+
+    assert len(logins) == 2
+    assert (tmp_path / 'second.bin').read_bytes() == CONTENT
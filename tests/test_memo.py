@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from ttm import cache
+import ttm.memo as memo
+import ttm.weather as weather
+
+DATETIMES = [datetime(2020, 6, 1) + timedelta(hours = hour) for hour in range(4)]
+LAT = np.array([10.0, 10.5, 11.0, 11.5])
+LON = np.array([-30.0, -30.5, -31.0, -31.5])
+
+class FakeISD:
+    """Stations only report within a gap of 6 hours"""
+    def __init__(self, max_gap):
+        self.max_gap = max_gap
+
+    def temperatures(self, datetimes, lat, lon, ftp = False):
+        values = np.full(len(datetimes), 25.0 if self.max_gap >= 6 else np.nan)
+        return values, np.where(np.isnan(values), np.nan, 50.0)
+
+    def blended_temperatures(self, datetimes, lat, lon, k = 4, method = 'idw', ftp = False):
+        return np.full(len(datetimes), 24.0), np.full(len(datetimes), 60.0)
+
+class FakeICOADSFile:
+    def __init__(self, input_date):
+        pass
+
+    @classmethod
+    def prefetch(cls, dates):
+        pass
+
+    def temperatures(self, datetimes, lat, lon):
+        return np.full(len(datetimes), 21.0), np.full(len(datetimes), 10.0)
+
+class FakeOISSTFile:
+    @classmethod
+    def prefetch(cls, dates):
+        pass
+
+    @classmethod
+    def open(cls, input_date):
+        return cls()
+
+    def sea_surface_temperatures(self, lat, lon):
+        return np.full(len(lat), 19.0), np.full(len(lat), 5.0)
+
+@pytest.fixture
+def fake_sources(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(weather, 'ISD', FakeISD)
+    monkeypatch.setattr(weather, 'ICOADSFile', FakeICOADSFile)
+    monkeypatch.setattr(weather, 'OISSTFile', FakeOISSTFile)
+    return tmp_path
+
+def resolve(provider):
+    temperatures, _ = provider.temperatures(DATETIMES, LAT, LON)
+    return temperatures
+
+PROVIDERS = [
+    weather.NOAAProvider(),
+    weather.NOAAProvider(use_ICOADS = True),
+    weather.NOAAProvider(max_gap = 6),
+    weather.NOAAProvider(interpolation = 'kriging'),
+    ]
+
+@pytest.mark.parametrize('warmup', PROVIDERS)
+@pytest.mark.parametrize('provider', PROVIDERS)
+def test_warm_memo_equals_cold_run(fake_sources, monkeypatch, tmp_path, warmup, provider):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'cold'))
+    cold = resolve(provider)
+
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'warm'))
+    resolve(warmup)
+    np.testing.assert_array_equal(resolve(provider), cold)
+
+def test_keys():
+    assert memo.keys(['isd-gap3', 'icoads', 'oisst']) == ['isd-gap3', 'icoads/isd-gap3', 'oisst/isd-gap3/icoads']
+    assert memo.ttl('oisst/isd-gap3') == min(cache.TTLS['oisst'], cache.TTLS['isd-lite'])
+
+def test_fallback_needs_same_sources(tmp_path):
+    with memo.WaypointMemo(str(tmp_path / 'waypoints.sqlite')) as waypoints:
+        hours = np.array([438000])
+        waypoints.store(hours, [10.0], [20.0], ['oisst/isd-gap3'], np.array([19.0]), np.array([5.0]))
+
+        found = waypoints.lookup(hours, [10.0], [20.0], memo.keys(['isd-gap3', 'icoads', 'oisst']))[2]
+        assert found[0] is None
+        found = waypoints.lookup(hours, [10.0], [20.0], memo.keys(['isd-gap3', 'oisst']))[2]
+        assert found[0] == 'oisst/isd-gap3'
@@ -0,0 +1,52 @@
+from datetime import timedelta
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ttm import cache
+from ttm.route import FileRoute
+
+def memory_mapped(array):
+    """True if the array is a view of a memory-mapped file"""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+@pytest.fixture
+def routefile(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    filepath = str(tmp_path / 'route.csv')
+    pd.DataFrame({
+        'Date': pd.date_range('2020-06-01', periods = 48, freq = 'h'),
+        'Lat': np.linspace(48.0, 50.0, 48),
+        'Lon': np.linspace(11.0, 8.0, 48)
+        }).to_csv(filepath, index = False)
+    return filepath
+
+@pytest.mark.parametrize('trim', [timedelta(0), timedelta(hours = 3)])
+def test_columns_memory_mapped(routefile, trim):
+    for _ in range(2):
+        route = FileRoute(routefile, trim, trim, 'Europe/Berlin')
+        assert all(memory_mapped(route.dataframe[column].values) for column in ['Lat', 'Lon'])
+        assert len(route.dataframe) == 48 - 2 * trim // timedelta(hours = 1)
+        assert route.dataframe['Lat'].iloc[0] == pytest.approx(48.0 + trim / timedelta(hours = 1) * 2 / 47)
+
+def test_unchanged_file_not_hashed(routefile, monkeypatch):
+    FileRoute(routefile, timedelta(0), timedelta(0), 'Europe/Berlin')
+
+    hashed = []
+    checksum = cache.checksum
+    monkeypatch.setattr(cache, 'checksum', lambda filepath: hashed.append(filepath) or checksum(filepath))
+    FileRoute(routefile, timedelta(0), timedelta(0), 'Europe/Berlin')
+    assert hashed == []
+
+    # Touched file with the same content is hashed once and not parsed again
+    stat = os.stat(routefile)
+    os.utime(routefile, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    route = FileRoute(routefile, timedelta(0), timedelta(0), 'Europe/Berlin')
+    assert hashed == [routefile]
+    assert memory_mapped(route.dataframe['Lat'].values)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+from PyFoam.Basics.DataStructures import Field, TupleProxy
+from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
+
+import ttm.openfoam as openfoam
+import ttm.runner as runner
+import ttm.schedule as schedule
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'ttm', 'templatecase', 'system', 'airInside', 'changeDictionaryDict')
+
+def changed_patches(tmp_path, borderregion, h, Ta):
+    """
+    Write the boundary entries of the continuous mode to a changeDictionaryDict, parse it again and
+    merge the entries into the patches of the template like changeDictionary does
+    """
+    filepath = tmp_path / 'changeDictionaryDict'
+    shutil.copy(TEMPLATE, filepath)
+    changeDictionaryDict = ParsedParameterFile(str(filepath))
+    patches = {
+        name: dict(entries) for name, entries in changeDictionaryDict['T']['boundaryField'].items()
+        }
+    patches['battery0_0_to_airInside'] = dict(openfoam.external_wall)
+
+    changeDictionaryDict['T']['boundaryField'] = schedule.boundary_field(borderregion, h, Ta)
+    changeDictionaryDict.writeFile()
+
+    changed = ParsedParameterFile(str(filepath))['T']['boundaryField']
+    for name, entries in changed.items():
+        patches[name].update(entries)
+    return filepath, {name: patches[name] for name in changed}
+
+def check_coefficient_mode(patch):
+    """Entries of externalWallHeatFluxTemperature in coefficient mode as read by OpenFOAM v2006"""
+    assert patch['type'] == 'externalWallHeatFluxTemperature'
+    assert patch['mode'] == 'coefficient'
+
+    # h is a scalarField, only uniform values are possible
+    h = patch['h']
+    if isinstance(h, Field):
+        assert h.isUniform()
+        h = h.value()
+    assert float(h) > 0
+
+    # Ta is a Function1
+    Ta = patch['Ta']
+    if isinstance(Ta, TupleProxy):
+        assert Ta[0] == 'table'
+        times = [row[0] for row in Ta[1]]
+        assert np.all(np.diff(times) > 0)
+        assert all(len(row) == 2 for row in Ta[1])
+    elif isinstance(Ta, Field):
+        assert Ta.isUniform()
+    else:
+        float(Ta)
+
+@pytest.mark.parametrize('borderregion', ['airInside', 'battery0_0'])
+def test_boundary_field_syntax(tmp_path, borderregion):
+    Ta = schedule.table([0, 3600, 5400.5], [280.15, 281.3, 279.95])
+    _, patches = changed_patches(tmp_path, borderregion, 12.5, Ta)
+
+    assert patches
+    for patch in patches.values():
+        check_coefficient_mode(patch)
+    assert list(patches.values())[-1]['Ta'][1] == [[0, 280.15], [3600, 281.3], [5400.5, 279.95]]
+
+def test_boundary_field_foamDictionary(tmp_path):
+    version = runner.openfoam_version()
+    if shutil.which('foamDictionary') is None or version is None or version < 2006:
+        pytest.skip('needs OpenFOAM v2006 or newer')
+
+    Ta = schedule.table([0, 3600], [280.15, 281.3])
+    filepath, _ = changed_patches(tmp_path, 'airInside', 12.5, Ta)
+    result = subprocess.run(
+        ['foamDictionary', '-entry', 'T.boundaryField.carrier.Ta', str(filepath)],
+        capture_output = True, text = True
+        )
+    assert result.returncode == 0, result.stderr
+    assert 'table' in result.stdout
+
+def test_boundary_field_unknown_region():
+    with pytest.raises(ValueError):
+        schedule.boundary_field('airOutside', 12.5, 280)
+
+def test_chunks():
+    h = [np.nan] * 30 + [10, 10.5, 10.9, 12, 12] + [np.nan]
+    segments = pd.DataFrame({
+        'seconds': np.arange(len(h)) * 3600.0,
+        'duration': np.full(len(h), 3600.0),
+        'h': h
+        })
+    assert schedule.chunks(segments) == [(0, 24), (24, 30), (30, 33), (33, 35), (35, 36)]
+    assert schedule.chunks(segments.iloc[:0]) == []
+
+    assert schedule.mean_heattransfer_coefficient(segments.iloc[30:33]) == pytest.approx((10 + 10.5 + 10.9) / 3)
+
+def test_openfoam_version(monkeypatch):
+    monkeypatch.setenv('WM_PROJECT_VERSION', 'v2006')
+    assert runner.openfoam_version() == 2006
+    monkeypatch.setenv('WM_PROJECT_VERSION', '8')
+    assert runner.openfoam_version() is None
+    monkeypatch.delenv('WM_PROJECT_VERSION')
+    assert runner.openfoam_version() is None
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+import time
+
+import ttm.weather as weather
+
+def test_oisst_open_threads(monkeypatch):
+    def init(self, input_date):
+        time.sleep(0.001)
+    monkeypatch.setattr(weather.OISSTFile, '__init__', init)
+    monkeypatch.setattr(weather, 'OISST_CACHESIZE', 2)
+    monkeypatch.setattr(weather, '_oisst_files', OrderedDict())
+
+    dates = [datetime(2020, 1, 1) + timedelta(days = i % 5) for i in range(2000)]
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        files = list(executor.map(weather.OISSTFile.open, dates))
+
+    assert all(isinstance(OISST, weather.OISSTFile) for OISST in files)
+    assert len(weather._oisst_files) == 2
+
+class FakeDownloader:
+    def __init__(self):
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def get_text(self, url):
+        with self.lock:
+            self.urls.append(url)
+        time.sleep(0.01)
+        return '<a href="oisst-avhrr-v02r01.20200101.nc">x</a>'
+
+def test_listing_read_once(monkeypatch):
+    downloader = FakeDownloader()
+    monkeypatch.setattr(weather, 'get_downloader', lambda: downloader)
+    monkeypatch.setattr(weather.NOAAFile, '_listings', {})
+
+    url = 'http://127.0.0.1/oisst/202001'
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        found = list(executor.map(lambda i: weather.OISSTFile._find_file(url, '20200101', 'nc'), range(16)))
+
+    assert downloader.urls == [url]
+    assert found == [url + '/oisst-avhrr-v02r01.20200101.nc'] * 16
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import time
+
+# Location of the cache, e.g. a shared directory for many transports
+CACHE_DIR = os.environ.get(
+    'TTM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ttm')
+    )
+# Total size of the cache in bytes, least recently used entries are evicted beyond
+MAX_SIZE = int(float(os.environ.get('TTM_CACHE_SIZE', 10)) * 1e9)
+
+# Time to live of the entries of each source in seconds, None for entries that do not expire
+TTLS = {
+    # Station lists and inventories are updated daily by NOAA
+    'isd-history': 30 * 86400,
+    # Files of the current year are extended with new readings
+    'isd-lite': 30 * 86400,
+    # Preliminary files are replaced by final files after about two weeks
+    'oisst': 30 * 86400,
+    'icoads': 365 * 86400,
+    'landsea': None,
+    # Parsed route files are validated against their source file
+    'routes': None,
+    # Road network of the routing service changes slowly
+    'routing': 180 * 86400,
+    # Memoized waypoints expire with the time to live of their source
+    'memo': None,
+    }
+# Sources that are never evicted by prune, the memo database is open while transports run
+# and expires its values individually, its access time is not updated by hits
+PINNED = {'memo'}
+
+def path(source: str, name: str):
+    """
+    Path of an entry in the cache. Entries are named by the file name of their source,
+    which identifies the content, e.g. station-year or day of the data.
+    """
+    directory = os.path.join(CACHE_DIR, source)
+    os.makedirs(directory, exist_ok = True)
+    return os.path.join(directory, name)
+
+def checksum(filepath: str):
+    """SHA-1 hash of the content of a file"""
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def _size(entry: str):
+    if os.path.isdir(entry):
+        return sum(
+            os.path.getsize(os.path.join(root, filename))
+            for root, _, filenames in os.walk(entry) for filename in filenames
+            )
+    return os.path.getsize(entry)
+
+def _remove(entry: str):
+    if os.path.isdir(entry):
+        shutil.rmtree(entry, ignore_errors = True)
+    elif os.path.exists(entry):
+        os.remove(entry)
+
+def expired(entry: str):
+    """Check if the entry is older than the time to live of its source"""
+    ttl = TTLS.get(os.path.basename(os.path.dirname(entry)))
+    return ttl is not None and time.time() - os.path.getmtime(entry) > ttl
+
+def fresh(entry: str):
+    """
+    Check if a valid entry exists. Expired entries are removed, so they are downloaded again.
+    The access time of the entry is updated for the least recently used eviction,
+    the modification time keeps the time of the download.
+    """
+    if not os.path.exists(entry):
+        return False
+    if expired(entry):
+        _remove(entry)
+        return False
+    os.utime(entry, (time.time(), os.path.getmtime(entry)))
+    return True
+
+def entries():
+    """All entries in the cache as list of dicts with source, path, size and access time"""
+    result = []
+    if not os.path.exists(CACHE_DIR):
+        return result
+    for source in sorted(os.listdir(CACHE_DIR)):
+        directory = os.path.join(CACHE_DIR, source)
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            entry = os.path.join(directory, name)
+            # Access time is read first, listing a directory entry updates its access time
+            atime = os.path.getatime(entry)
+            result.append({'source': source, 'path': entry, 'size': _size(entry), 'atime': atime})
+    return result
+
+def stats():
+    """Number of entries and size of the cache for each source"""
+    result = {}
+    for entry in entries():
+        source = result.setdefault(entry['source'], {'entries': 0, 'size': 0, 'expired': 0})
+        source['entries'] += 1
+        source['size'] += entry['size']
+        source['expired'] += expired(entry['path'])
+    return result
+
+def prune(max_size = None):
+    """
+    Remove expired entries, then least recently used entries until the cache fits into max_size.
+    Entries of pinned sources are counted in the size but not removed.
+
+    Returns:
+        number of removed entries and freed bytes
+    """
+    max_size = MAX_SIZE if max_size is None else max_size
+    removed, freed = 0, 0
+
+    remaining = []
+    for entry in entries():
+        if expired(entry['path']):
+            _remove(entry['path'])
+            removed += 1
+            freed += entry['size']
+        else:
+            remaining.append(entry)
+
+    size = sum(entry['size'] for entry in remaining)
+    for entry in sorted(remaining, key = lambda entry: entry['atime']):
+        if size <= max_size:
+            break
+        if entry['source'] in PINNED:
+            continue
+        _remove(entry['path'])
+        size -= entry['size']
+        removed += 1
+        freed += entry['size']
+
+    return removed, freed
+
+def clear(source = None):
+    """Delete all entries of a source or the whole cache"""
+    _remove(CACHE_DIR if source is None else os.path.join(CACHE_DIR, source))
+
+def report():
+    """Print the statistics of the cache"""
+    print('Cache directory: {}'.format(CACHE_DIR))
+    total = 0
+    for source, values in stats().items():
+        total += values['size']
+        print('{0:<12} {1:>7} entries {2:>10.1f} MB {3:>7} expired'.format(
+            source, values['entries'], values['size'] / 1e6, values['expired']
+            ))
+    print('Total {0:.1f} MB of {1:.1f} MB'.format(total / 1e6, MAX_SIZE / 1e6))
@@ -6,6 +6,8 @@ import numpy as np
 from PyFoam.Basics.DataStructures import Vector
 from scipy.spatial.transform import Rotation 
 
+import ttm.runner as runner
+
 # Number of individual packages (regions) in the stl
 # (number of layers, packages per layer) 
 NUMBER_PACKAGES = {
@@ -89,24 +91,29 @@ class Cargo:
         self.orientation = orientation
 
     def vector_to_string(self, vector):
-        """Transform a vector with three entries into a string for terminal commands"""
-        return "'(" + str(vector[0]) + ' ' + str(vector[1]) + ' ' + str(vector[2]) + ")'"
+        """Transform a vector with three entries into a string for arguments of OpenFOAM utilities"""
+        return "(" + str(vector[0]) + ' ' + str(vector[1]) + ' ' + str(vector[2]) + ")"
     
     def move_STL(self, case, target):
         """Move the STL to the right position in the carrier."""
+        logfolder = os.path.join(case.name, 'logs')
+        logfile = os.path.join(logfolder, 'log.move_STL')
+        timingfile = os.path.join(logfolder, runner.TIMINGFILE)
+        targetpath = os.path.join(case.constantDir(), "triSurface", target)
 
         # Copy STL form template STL and bring it in the right orientation
-        os.system(
-            'surfaceTransformPoints -rollPitchYaw ' + self.vector_to_string(self.orientation) + " " + 
-            os.path.join(case.constantDir(), "triSurface", self.templateSTL) + " " + 
-            os.path.join(case.constantDir(), "triSurface", target) + '> {}/log.move_STL'.format(case.name) 
+        runner.run(
+            [
+                'surfaceTransformPoints', '-rollPitchYaw', self.vector_to_string(self.orientation),
+                os.path.join(case.constantDir(), "triSurface", self.templateSTL), targetpath
+            ],
+            logfile, timingfile = timingfile
             )
 
         # Move STL to its position
-        os.system(
-            'surfaceTransformPoints -translate ' + self.vector_to_string(self.position) + " " + 
-            os.path.join(case.constantDir(), "triSurface", target) + " " + 
-            os.path.join(case.constantDir(), "triSurface", target) + '>> {}/log.move_STL'.format(case.name)
+        runner.run(
+            ['surfaceTransformPoints', '-translate', self.vector_to_string(self.position), targetpath, targetpath],
+            logfile, append = True, timingfile = timingfile
             )
         self.STL = target
 
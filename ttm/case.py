@@ -4,28 +4,28 @@ import csv
 from datetime import datetime, timedelta
 import glob
 import json
-from math import ceil, floor
+from math import ceil
 import os
-import pytz
 import re
 import shutil
 import sys
 
-import geopy.distance
 import numpy as np
 import pandas as pd
-from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
 from PyFoam.RunDictionary.SolutionDirectory import SolutionDirectory
 from PyFoam.Basics.DataStructures import Vector
 from scipy.spatial.transform import Rotation
 import tikzplotlib
-import timezonefinder
-from tzwhere import tzwhere
 
 import ttm.convection as convection
+import ttm.dictionaries as dictionaries
 from ttm.cargo import cargoDecoder
+from ttm import geodesy
 import ttm.openfoam as openfoam
-from ttm.route import direction_crossover, add_seconds
+import ttm.runner as runner
+import ttm.schedule as schedule
+import ttm.timezones as timezones
+from ttm.route import add_seconds
 from ttm.transport import TransportDecoder
 from ttm.weather import onsea
 
@@ -67,6 +67,9 @@ TRANSPORTTYPES = {
 }
 # Max speed for natural convection
 SPEEDTHERSHOLD = 4
+# Oldest OpenFOAM release of openfoam.com supported by the continuous mode, Ta of
+# externalWallHeatFluxTemperature is read as Function1 table
+CONTINUOUS_VERSION = 2006
 
 SOLARINTENSITY = {
     '1': 1230,
@@ -106,6 +109,8 @@ class Case(SolutionDirectory):
             os.makedirs(os.path.join(self.name,'logs'))
 
         self.purge_write_switch = False
+        # Parsed dictionaries are shared by all cases of the process
+        self.dictionaries = dictionaries.manager()
 
         #Add scripts and log folder to control simulation to cloneCase
         self.addToClone('Allrun.pre')
@@ -146,21 +151,20 @@ class Case(SolutionDirectory):
         # Convert to Kelvin
         temperature += 273.15
         print('Setting initial temperature for air and cargo to {} Kelvin'.format(temperature))
-        changeDictionaryDict_airInside = ParsedParameterFile(
+        changeDictionaryDict_airInside = self.dictionaries.get(
             os.path.join(self.systemDir(), "airInside", "changeDictionaryDict")
             )
-        changeDictionaryDict_battery = ParsedParameterFile(
+        changeDictionaryDict_battery = self.dictionaries.get(
             os.path.join(self.systemDir(), "battery_template", "changeDictionaryDict")
             )
 
         changeDictionaryDict_airInside['T']['internalField'] = 'uniform {}'.format(temperature)
         changeDictionaryDict_battery['T']['internalField'] = 'uniform {}'.format(temperature)
 
-        changeDictionaryDict_airInside.writeFile()
-        changeDictionaryDict_battery.writeFile()
+        self.dictionaries.flush()
 
     def initial_temperature(self):
-        initial_temperature = ParsedParameterFile(
+        initial_temperature = self.dictionaries.get(
             os.path.join(self.name, '0', 'airInside', 'T')
             )['internalField'].val
         return initial_temperature
@@ -186,12 +190,12 @@ class Case(SolutionDirectory):
 
         transport = TRANSPORTTYPES[transporttype]
         
-        blockMeshDict = ParsedParameterFile(os.path.join(self.systemDir(), "blockMeshDict"))
-        snappyHexMeshDict = ParsedParameterFile(os.path.join(self.systemDir(), "snappyHexMeshDict"))
-        changeDictionaryDict = ParsedParameterFile(
+        blockMeshDict = self.dictionaries.get(os.path.join(self.systemDir(), "blockMeshDict"))
+        snappyHexMeshDict = self.dictionaries.get(os.path.join(self.systemDir(), "snappyHexMeshDict"))
+        changeDictionaryDict = self.dictionaries.get(
             os.path.join(self.systemDir(), "airInside", "changeDictionaryDict")
             )
-        boundaryRadiationProperties = ParsedParameterFile(
+        boundaryRadiationProperties = self.dictionaries.get(
             os.path.join(self.constantDir(), "airInside", "boundaryRadiationProperties")
             )
 
@@ -221,10 +225,7 @@ class Case(SolutionDirectory):
         boundaryRadiationProperties['carrier'][
             'wallAbsorptionEmissionModel']['emissivity'] = '( {0} {0} )'.format(transport['absorptivity'])
 
-        blockMeshDict.writeFile()
-        changeDictionaryDict.writeFile()
-        snappyHexMeshDict.writeFile()
-        boundaryRadiationProperties.writeFile()
+        self.dictionaries.flush()
 
     def switch_to_car(self):
         # Chech if case is valid
@@ -234,28 +235,25 @@ class Case(SolutionDirectory):
         )
         self.remove_airInside()
         # Change the boundary condition of the battery region to a external wall
-        changeDictionaryDict =  ParsedParameterFile(os.path.join(self.systemDir(), "battery0_0", "changeDictionaryDict"))
+        changeDictionaryDict =  self.dictionaries.get(os.path.join(self.systemDir(), "battery0_0", "changeDictionaryDict"))
         # Apply a thermal resistance representing carbody
         openfoam.external_wall['kappaLayers'] = '( {} )'.format(TRANSPORTTYPES['car']['kappaLayers'])
         openfoam.external_wall['thicknessLayers'] = '( {} )'.format(TRANSPORTTYPES['car']['thicknessLayers'])
         changeDictionaryDict['T']['boundaryField']['battery0_0_to_airInside'] = openfoam.external_wall
         if 'internalField' in changeDictionaryDict['T']:
             del changeDictionaryDict['T']['internalField']
-        changeDictionaryDict.writeFile()
 
-        os.system(os.path.join(self.name,"ChangeDictionary") + ' battery0_0')
+        self._execute(os.path.join(self.name, 'ChangeDictionary'), 'battery0_0')
 
         self.load_weatherdata()
         if 'onsea' not in self.weatherdata.columns:
             print('Checking if waypoints are on sea or not')
             lats = self.weatherdata['Lat'].values
             lons = self.weatherdata['Lon'].values 
-            self.weatherdata['onsea'] = [onsea(lats[i], lons[i]) for i in range(len(lats))] 
+            self.weatherdata['onsea'] = onsea(lats, lons)
             self.weatherdata.to_csv(
                 os.path.join(os.path.dirname(self.name), 'weatherdata.csv'), encoding='utf-8', index=False
                 )
-            
-        self._move_logs()
     
     def load_cargo(self, cargo):
         """Loads the carrier with cargo. New regions for cargo 
@@ -265,9 +263,10 @@ class Case(SolutionDirectory):
 
         self.cargo = cargo
         # Open files that need to be modified
-        regionProperties = ParsedParameterFile(os.path.join(self.constantDir(),'regionProperties'))
-        snappyHexMeshDict = ParsedParameterFile(os.path.join(self.systemDir(), "snappyHexMeshDict"))
-        controlDict = ParsedParameterFile(os.path.join(self.systemDir(), "controlDict"))
+        regionProperties = self.dictionaries.get(os.path.join(self.constantDir(),'regionProperties'))
+        snappyHexMeshDict = self.dictionaries.get(os.path.join(self.systemDir(), "snappyHexMeshDict"))
+        controlDict = self.dictionaries.get(os.path.join(self.systemDir(), "controlDict"))
+        changeDictionaryDict = self.dictionaries.get(os.path.join(self.systemDir(), 'airInside', 'changeDictionaryDict'))
 
         # Iteration over all cargo entries
         for i in range(len(cargo)):
@@ -294,8 +293,11 @@ class Case(SolutionDirectory):
                     shutil.copytree(os.path.join(self.constantDir(), "battery_template"), os.path.join(self.name, "constant", battery.name))
                 if not os.path.exists( os.path.join(self.name, "0.org", battery.name)):
                     shutil.copytree(os.path.join(self.name, "0.org", "battery_template"), os.path.join(self.name, "0.org", battery.name))
-                # Write thermophysical properties to the region
-                thermophysicalProperties = ParsedParameterFile(os.path.join(self.constantDir(), battery.name, 'thermophysicalProperties'))
+                # Write thermophysical properties to the region, parsed template files are reused for the copies
+                thermophysicalProperties = self.dictionaries.get(
+                    os.path.join(self.constantDir(), battery.name, 'thermophysicalProperties'),
+                    like = os.path.join(self.constantDir(), 'battery_template', 'thermophysicalProperties')
+                    )
                 thermophysicalProperties['mixture']['thermodynamics']['Cp'] = battery.thermal_capacity()
                 thermophysicalProperties['mixture']['equationOfState']['rho'] = battery.density()
                 thermophysicalProperties['mixture']['equationOfState']['rho'] = battery.density()
@@ -305,45 +307,44 @@ class Case(SolutionDirectory):
                     thermalconductivity[1],
                     thermalconductivity[2]
                     )
-                thermophysicalProperties.writeFile()
 
                 # Write boundary conditions for battery region and airInside region
-                temperaturefile = ParsedParameterFile(os.path.join(self.name, "0.org", battery.name, 'T'))
+                temperaturefile = self.dictionaries.get(
+                    os.path.join(self.name, "0.org", battery.name, 'T'),
+                    like = os.path.join(self.name, "0.org", 'battery_template', 'T')
+                    )
                 THICKNESS_CARTON = 0.01
                 KAPPA_CARTON = 0.05 
                 openfoam.region_coupling_solid_anisotrop['thicknessLayers'] = '( {} )'.format(THICKNESS_CARTON)
                 openfoam.region_coupling_solid_anisotrop['kappaLayers'] = '( {} )'.format(KAPPA_CARTON)
                 # changeDictionaryDict['T']['boundaryField'][battery.name + '_to_.*'] = openfoam.region_coupling_solid_anisotrop
                 temperaturefile['boundaryField']['".*"'] = openfoam.region_coupling_solid_anisotrop
-                temperaturefile.writeFile()
 
-                changeDictionaryDict = ParsedParameterFile(os.path.join(self.systemDir(), 'airInside', 'changeDictionaryDict'))
                 openfoam.region_coupling_fluid['thicknessLayers'] = '( {} )'.format(THICKNESS_CARTON)
                 # openfoam.region_coupling_fluid['thicknessLayers'] = '( {} )'.format(battery.packaging_thickness())
                 openfoam.region_coupling_fluid['kappaLayers'] = '( {} )'.format(KAPPA_CARTON)
                 # openfoam.region_coupling_fluid['kappaLayers'] = '( {} )'.format(battery.thermalconductivity_packaging)
                 changeDictionaryDict['T']['boundaryField']['airInside_to_'+ battery.name] = openfoam.region_coupling_fluid
-                changeDictionaryDict.writeFile()
 
                 #Names of the solid regions are in third entry of the list regions, adding batteries
                 regionProperties['regions'][3].append(battery.name)
 
                 self.create_function_objects(battery.name, controlDict)
 
-        regionProperties.writeFile()
-        snappyHexMeshDict.writeFile()
-        controlDict.writeFile()
+        self.dictionaries.flush()
 
     def load_weatherdata(self):
         # Load weatherdata from csv file
         weatherdata_path = os.path.join(self.name, os.pardir, 'weatherdata.csv') 
         self.weatherdata = pd.read_csv(weatherdata_path, parse_dates = ['Date'], date_parser = pd.to_datetime)
+        # Weatherdata of earlier versions has no kinematics of the segments
+        if 'speed' not in self.weatherdata.columns:
+            geodesy.add_kinematics(self.weatherdata)
         
     def create_mesh(self):
-        os.system(os.path.join(self.name,"Allrun.pre"))
-        self._move_logs()
+        self._execute(os.path.join(self.name, 'Allrun.pre'))
 
-        changeDictionaryDict = ParsedParameterFile(os.path.join(self.systemDir(), "airInside", "changeDictionaryDict"))
+        changeDictionaryDict = self.dictionaries.get(os.path.join(self.systemDir(), "airInside", "changeDictionaryDict"))
 
         # Delete values that do not need to be changed anymore, so values for the last timestep are not overwritten 
         # when OpenFOAM function changeDict is executed
@@ -352,13 +353,13 @@ class Case(SolutionDirectory):
         del changeDictionaryDict['p_rgh']
         del changeDictionaryDict['p']
 
-        changeDictionaryDict.writeFile()
+        self.dictionaries.flush()
 
     def _get_dominant_length(self, region, speed):
         """Get the dominant length for calculation of convection"""
         # Use dimesnions of carrier for airInside
         if region == 'airInside':
-            snappyHexMeshDict = ParsedParameterFile(os.path.join(self.systemDir(), "snappyHexMeshDict"))
+            snappyHexMeshDict = self.dictionaries.get(os.path.join(self.systemDir(), "snappyHexMeshDict"))
             dimensions = snappyHexMeshDict['geometry']['carrier']['max']
         # And dimensions of cargo for cargo regions
         else:
@@ -382,7 +383,7 @@ class Case(SolutionDirectory):
         # If times has only one entry, that means only 0 folder exists, 
         # thus average path temperature is initial temperature
         if times[-1] == '0':
-            T_W = ParsedParameterFile(
+            T_W = self.dictionaries.get(
                 os.path.join(self.name, '0', 'airInside', 'T')
                 )['internalField'].val
         # Else use average patch temperature
@@ -442,21 +443,11 @@ class Case(SolutionDirectory):
             os.remove(path_solver_logfile)
 
         # Open files that need to be modified
-        changeDictionaryDict = ParsedParameterFile(os.path.join(self.systemDir(), borderregion, "changeDictionaryDict"))
-        controlDict = ParsedParameterFile(os.path.join(self.systemDir(), "controlDict"))
-        radiationProperties =  ParsedParameterFile(os.path.join(self.constantDir(), borderregion, "radiationProperties"))
+        changeDictionaryDict = self.dictionaries.get(os.path.join(self.systemDir(), borderregion, "changeDictionaryDict"))
+        controlDict = self.dictionaries.get(os.path.join(self.systemDir(), "controlDict"))
+        radiationProperties =  self.dictionaries.get(os.path.join(self.constantDir(), borderregion, "radiationProperties"))
 
-        latesttime = self.latesttime()
-
-        # Delete times that are not complete, needed if simulation stops before finished and is then restarted
-        while sorted(self.regions_in_latesttime()) != sorted(self.regions()):
-            processor_directories = glob.glob(os.path.join(self.name, 'processor*'))
-            latesttime_processor_directories = [
-                os.path.join(directory, str(int(latesttime))) for directory in processor_directories
-                ]
-            for directory in latesttime_processor_directories:
-                shutil.rmtree(directory)
-            latesttime = self.latesttime()
+        latesttime = self._remove_incomplete_times()
 
         transport_duration = self.weatherdata['Date'].iloc[-1] - self.weatherdata['Date'].iloc[0] 
         transport_duration = transport_duration.total_seconds()
@@ -465,141 +456,221 @@ class Case(SolutionDirectory):
         current_timestamp = self.weatherdata['Date'].iloc[0] + timedelta(seconds = latesttime)
         i = self.weatherdata['Date'].sub(current_timestamp).abs().idxmin()
 
+        # Parameters of all segments are calculated before the first solver run
+        segments = self.plan(borderregion).to_dict('records')
+
         # Iterate over weatherdata
         while latesttime < transport_duration:
-            # Read temperature and transform from Celsius to Kelvin
-            temperature = self.weatherdata['T'].values[i] + 273.15
+            segment = segments[i]
+            temperature = segment['Ta']
 
-            current_timestamp = self.weatherdata['Date'].iloc[i]
+            current_timestamp = segment['Date']
             string_current_timestamp = current_timestamp.strftime('%Y-%m-%d_%H:%M:%S')
 
             # Update endTime of the simulation
-            endTime_delta = self.weatherdata['Date'].values[i+1] - self.weatherdata['Date'].values[i]
-            endTime_delta = endTime_delta / np.timedelta64(1, 's')
-            writeinterval = np.floor(endTime_delta)
-            controlDict['writeInterval'] = writeinterval
-            controlDict['endTime'] = latesttime + endTime_delta
-            # Limit timesteps to fixed value for small writeintervals, or timesteps can be bigger than writeInterval
-            if writeinterval < 1000:
-                controlDict['adjustTimeStep'] = 'no'
-            else:
-                controlDict['adjustTimeStep'] = 'yes'
-            controlDict.writeFile()
-
-            # Calculate travelspeed between waypoints
-            coordinates = self.weatherdata[['Lat', 'Lon']].values[i]
-            coordinates_next = self.weatherdata[['Lat', 'Lon']].values[i+1]
-            distance = geopy.distance.distance(coordinates, coordinates_next).m
-            travelspeed = distance / endTime_delta
-            # Set travelspeed to 0 for cartransports on sea, because car is inside ship
-            if borderregion == 'battery0_0':
-                if self.weatherdata['onsea'].values[i] == True:
-                    travelspeed = 0
+            controlDict['writeInterval'] = segment['writeInterval']
+            controlDict['endTime'] = latesttime + segment['duration']
+            controlDict['adjustTimeStep'] = segment['adjustTimeStep']
+
+            travelspeed = segment['speed']
 
             # #Upadate positon
-            self._update_radiationProperties(
-                radiationProperties, current_timestamp, coordinates, coordinates_next
-                )
+            self._apply_radiationProperties(radiationProperties, segment)
 
-            heattransfer_coefficient, T_W = self.heattransfer_coefficient(temperature, travelspeed, region = borderregion)
+            # Natural convection depends on the current wall temperature
+            if np.isnan(segment['h']):
+                heattransfer_coefficient, T_W = self.heattransfer_coefficient(temperature, travelspeed, region = borderregion)
+            else:
+                heattransfer_coefficient, T_W = segment['h'], None
             # Write changes to changeDictionaryDict
-            if borderregion == 'airInside':
-                changeDictionaryDict['T']['boundaryField'] = {}
-                changeDictionaryDict['T']['boundaryField']['carrier'] = {
-                    'h': heattransfer_coefficient,
-                    'Ta': temperature,
-                }
-                changeDictionaryDict['T']['boundaryField']['bottom'] = {
-                    'Ta': temperature
-                }
-            elif borderregion == 'battery0_0':
-                changeDictionaryDict['T']['boundaryField'] = {}
-                changeDictionaryDict['T']['boundaryField']['battery0_0_to_airInside'] = {
-                    'h': heattransfer_coefficient,
-                    'Ta': temperature,
-                }
-            changeDictionaryDict.writeFile()
-            
+            changeDictionaryDict['T']['boundaryField'] = schedule.boundary_field(
+                borderregion, heattransfer_coefficient, temperature
+                )
+
             # Print to console            
             print('Timestamp: {} (UTC)'.format(string_current_timestamp))
-            print('Latitude: {0} Longitude: {1}'.format(round(coordinates[0], 3), round(coordinates[1], 3)))
+            print('Latitude: {0} Longitude: {1}'.format(round(segment['Lat'], 3), round(segment['Lon'], 3)))
             print('Temperature: {}'.format(round(temperature, 1)))
             print('Travelspeed: {}'.format(round(travelspeed, 2)))
-            print('Heattransfer coeffcient: {0} with average wall temperature: {1}'.format(round(heattransfer_coefficient, 2), round(T_W, 1)))
+            if T_W is None:
+                print('Heattransfer coeffcient: {}'.format(round(heattransfer_coefficient, 2)))
+            else:
+                print('Heattransfer coeffcient: {0} with average wall temperature: {1}'.format(round(heattransfer_coefficient, 2), round(T_W, 1)))
 
             #Write travelspeed and heattransfercoeffiecient to file
             self._save_data([latesttime, travelspeed], 'speed.csv')
             self._save_data([latesttime, heattransfer_coefficient], 'heattransfercoefficient.csv')
 
             # Execute solver
-            self._move_logs()
-            os.system(os.path.join(self.name,"ChangeDictionary") + ' ' + borderregion)
-            os.system(os.path.join(self.name,"Run"))
+            self._execute(os.path.join(self.name, 'ChangeDictionary'), borderregion)
+            self._execute(os.path.join(self.name, 'Run'))
 
             # Purge write
             if self.purge_write_switch == True:
                 self.purge_write() 
 
             #File management of log files
-            target = os.path.join(self.name,"log.chtMultiRegionFoam" + '_' + string_current_timestamp)
-            shutil.move(path_solver_logfile, target)
+            target = os.path.join(self.name, 'logs', "log.chtMultiRegionFoam" + '_' + string_current_timestamp)
+            shutil.move(os.path.join(self.name, 'logs', "log.chtMultiRegionFoam"), target)
 
             latesttime = float(self.getParallelTimes()[-1])
             i = i + 1
 
         print('Last timestep finished')
-        self._move_logs()
-
-    def _update_radiationProperties(
-        self, radiationProperties, timestamp, coordinates, coordinates_next
-        ):
-        startdate = self.weatherdata['Date'].iloc[0]
-        # Get offset to UTC time
-        localStandardMeridian = utcoffset(
-            timestamp, coordinates[0], coordinates[1]
+
+    def run_continuous(self, borderregion = 'airInside'):
+        """
+        Execute the simulation with one solver run for consecutive waypoints with similar heattransfer
+        coefficient, each solver run covers at most one day.
+
+        Ambient temperature of the waypoints is written as time table of the boundary condition,
+        heattransfer coefficient and solar radiation are updated at the start of each solver run.
+        """
+        if borderregion not in ['airInside', 'battery0_0']:
+            raise ValueError('Only support for borderregions airInside for carrier transport or battery0_0 for car transport')
+
+        version = runner.openfoam_version()
+        if version is None or version < CONTINUOUS_VERSION:
+            raise ValueError('Continuous mode needs OpenFOAM v{0} or newer, found {1}'.format(
+                CONTINUOUS_VERSION, os.environ.get('WM_PROJECT_VERSION', 'no sourced OpenFOAM')
+                ))
+
+        self.load_weatherdata()
+
+        path_solver_logfile = os.path.join(self.name,"log.chtMultiRegionFoam")
+        if os.path.exists(path_solver_logfile):
+            os.remove(path_solver_logfile)
+
+        changeDictionaryDict = self.dictionaries.get(os.path.join(self.systemDir(), borderregion, "changeDictionaryDict"))
+        controlDict = self.dictionaries.get(os.path.join(self.systemDir(), "controlDict"))
+        radiationProperties =  self.dictionaries.get(os.path.join(self.constantDir(), borderregion, "radiationProperties"))
+
+        latesttime = self._remove_incomplete_times()
+        seconds = self.weatherdata['seconds'].values
+        ambient = self.weatherdata['T'].values + 273.15
+
+        # Solver runs of the remaining segments, starting at the segment of the latest time
+        segments = self.plan(borderregion)
+        i = max(int(np.searchsorted(segments['seconds'].values, latesttime, side = 'right')) - 1, 0)
+        if latesttime >= seconds[-1]:
+            i = len(segments)
+
+        for start, stop in schedule.chunks(segments.iloc[i:]):
+            chunk = segments.iloc[i + start:i + stop]
+            first = chunk.iloc[0]
+            string_current_timestamp = first['Date'].strftime('%Y-%m-%d_%H:%M:%S')
+
+            # Waypoints of the chunk including the end of the last segment
+            positions = slice(i + start, i + stop + 1)
+            endtime = seconds[i + stop]
+
+            writeinterval = np.floor(endtime - first['seconds'])
+            controlDict['writeInterval'] = writeinterval
+            controlDict['endTime'] = endtime
+            controlDict['adjustTimeStep'] = 'no' if writeinterval < 1000 else 'yes'
+
+            self._apply_radiationProperties(radiationProperties, first)
+
+            # Natural convection depends on the current wall temperature
+            if np.isnan(first['h']):
+                heattransfer_coefficient, T_W = self.heattransfer_coefficient(first['Ta'], first['speed'], region = borderregion)
+            else:
+                heattransfer_coefficient, T_W = schedule.mean_heattransfer_coefficient(chunk), None
+
+            Ta = schedule.table(seconds[positions], ambient[positions])
+            changeDictionaryDict['T']['boundaryField'] = schedule.boundary_field(
+                borderregion, heattransfer_coefficient, Ta
+                )
+
+            # Print to console
+            print('Timestamp: {0} (UTC) with {1} waypoints until {2} (UTC)'.format(
+                string_current_timestamp, len(chunk),
+                self.weatherdata['Date'].iloc[i + stop].strftime('%Y-%m-%d_%H:%M:%S')
+                ))
+            print('Latitude: {0} Longitude: {1}'.format(round(first['Lat'], 3), round(first['Lon'], 3)))
+            print('Temperature: {0} to {1}'.format(round(chunk['Ta'].min(), 1), round(chunk['Ta'].max(), 1)))
+            if T_W is None:
+                print('Heattransfer coeffcient: {}'.format(round(heattransfer_coefficient, 2)))
+            else:
+                print('Heattransfer coeffcient: {0} with average wall temperature: {1}'.format(round(heattransfer_coefficient, 2), round(T_W, 1)))
+
+            # Write travelspeed and heattransfercoefficient of the waypoints to file
+            for _, segment in chunk.iterrows():
+                self._save_data([segment['seconds'], segment['speed']], 'speed.csv')
+                self._save_data([segment['seconds'], heattransfer_coefficient], 'heattransfercoefficient.csv')
+
+            # Execute solver
+            self._execute(os.path.join(self.name, 'ChangeDictionary'), borderregion)
+            self._execute(os.path.join(self.name, 'Run'))
+
+            if self.purge_write_switch == True:
+                self.purge_write()
+
+            target = os.path.join(self.name, 'logs', "log.chtMultiRegionFoam" + '_' + string_current_timestamp)
+            shutil.move(os.path.join(self.name, 'logs', "log.chtMultiRegionFoam"), target)
+
+        print('Last timestep finished')
+
+    def _remove_incomplete_times(self):
+        """
+        Delete times that are not complete, needed if simulation stops before finished and is then restarted
+
+        Returns:
+            latest complete time
+        """
+        latesttime = self.latesttime()
+        while sorted(self.regions_in_latesttime()) != sorted(self.regions()):
+            processor_directories = glob.glob(os.path.join(self.name, 'processor*'))
+            latesttime_processor_directories = [
+                os.path.join(directory, str(int(latesttime))) for directory in processor_directories
+                ]
+            for directory in latesttime_processor_directories:
+                shutil.rmtree(directory)
+            latesttime = self.latesttime()
+        return latesttime
+
+    def plan(self, borderregion = 'airInside'):
+        """
+        Calculate the parameters of all solver runs of the transport and save them as schedule.csv
+        next to the weatherdata, see schedule.segments
+        """
+        self.load_weatherdata()
+        offsets = timezones.utcoffsets(self.weatherdata['Date'], self.weatherdata['Lat'], self.weatherdata['Lon'])
+        segments = schedule.segments(
+            self.weatherdata, offsets, self._get_dominant_length(borderregion, SPEEDTHERSHOLD), SPEEDTHERSHOLD,
+            SOLARINTENSITY, EXTINCTIONCOEFFICENT, onsea = borderregion == 'battery0_0'
             )
-        if localStandardMeridian != None:
-            # Transform UTC time to local time
-            startdate += timedelta(hours = localStandardMeridian)
-            # Get time in decimal format
-            starttime = startdate.time()
-            starttime = starttime.hour + starttime.minute / 60 + starttime.second / 3600
-            # Get startday as the number of the day in given year
-            startday = startdate.timetuple().tm_yday
-       
-            radiationProperties['solarLoadCoeffs']['startDay'] = startday
-            radiationProperties['solarLoadCoeffs']['startTime'] = starttime
-            radiationProperties['solarLoadCoeffs']['localStandardMeridian'] = localStandardMeridian
+        segments.to_csv(os.path.join(self.name, os.pardir, 'schedule.csv'), encoding='utf-8', index=False)
+        return segments
+
+    def _apply_radiationProperties(self, radiationProperties, segment):
+        """Write the solar parameters of a segment of the schedule to radiationProperties"""
+        if not np.isnan(segment['localStandardMeridian']):
+            radiationProperties['solarLoadCoeffs']['startDay'] = int(segment['startDay'])
+            radiationProperties['solarLoadCoeffs']['startTime'] = segment['startTime']
+            radiationProperties['solarLoadCoeffs']['localStandardMeridian'] = segment['localStandardMeridian']
 
         radiationProperties['radiation'] = 'on'
-        radiationProperties['solarLoadCoeffs']['latitude'] = coordinates[0]
-        radiationProperties['solarLoadCoeffs']['longitude'] = coordinates[1]
-        radiationProperties['solarLoadCoeffs']['A'] = SOLARINTENSITY[str(timestamp.month)]
-        radiationProperties['solarLoadCoeffs']['B'] = EXTINCTIONCOEFFICENT[str(timestamp.month)]
-        # Calculate vector for east in grid coordinates
-        direction = direction_crossover(coordinates, coordinates_next)
-        # latitude matches y, longitude matches x
-        x_axis = np.array([direction[1], direction[0], 0])
-        east_vector = np.array([1, 1, 0])
-        east_vector = east_vector / np.linalg.norm(east_vector)
-        east_vector = coordinate_transformation(x_axis, east_vector)
+        radiationProperties['solarLoadCoeffs']['latitude'] = segment['Lat']
+        radiationProperties['solarLoadCoeffs']['longitude'] = segment['Lon']
+        radiationProperties['solarLoadCoeffs']['A'] = segment['A']
+        radiationProperties['solarLoadCoeffs']['B'] = segment['B']
+        east_vector = [segment['gridEast_x'], segment['gridEast_y'], segment['gridEast_z']]
         if not np.isnan(east_vector).any():
-            radiationProperties['solarLoadCoeffs']['gridEast'] = Vector(east_vector[0], east_vector[1], east_vector[2])
-        radiationProperties.writeFile()
+            radiationProperties['solarLoadCoeffs']['gridEast'] = Vector(*east_vector)
 
     def reconstruct(self):
         """Reconstruct the decomposed case. Executes OpenFOAM function reconstructPar in the case directory."""
         latesttimedirectory = os.path.join(self.name, self.getParallelTimes()[-1])
 
         if not os.path.exists(latesttimedirectory):
-            os.system(os.path.join(self.name,"Reconstruct"))
-            self._move_logs()
+            self._execute(os.path.join(self.name, 'Reconstruct'))
         else:
             print('Case is already reconstructed')
 
     def cpucores(self):
         """Return the number of used cpu cores, i.e. number of subdomains"""
-        decomposeParDict = ParsedParameterFile(os.path.join(
+        decomposeParDict = self.dictionaries.get(os.path.join(
                 self.systemDir(), "decomposeParDict")
                 )
         return int(decomposeParDict['numberOfSubdomains'])
@@ -613,13 +684,13 @@ class Case(SolutionDirectory):
         elif not self.processorDirs():
             print("Number of CPU cores set to {}".format(number))
 
-            decomposeParDict_system = ParsedParameterFile(os.path.join(
+            decomposeParDict_system = self.dictionaries.get(os.path.join(
                 self.systemDir(), "decomposeParDict")
                 )
-            decomposeParDict_airInside = ParsedParameterFile(os.path.join(
+            decomposeParDict_airInside = self.dictionaries.get(os.path.join(
                 self.systemDir(), "airInside", "decomposeParDict")
                 )
-            decomposeParDict_battery_template = ParsedParameterFile(
+            decomposeParDict_battery_template = self.dictionaries.get(
                 os.path.join(self.systemDir(), "battery_template", "decomposeParDict")
                 )
 
@@ -631,7 +702,7 @@ class Case(SolutionDirectory):
 
             for decomposeParDict in list_decomposeParDicts:
                 decomposeParDict['numberOfSubdomains'] = number
-                decomposeParDict.writeFile()
+            self.dictionaries.flush()
         else:
             raise Exception('Case already decomposed. Clean case before changing number of subdomains.')
 
@@ -869,13 +940,16 @@ class Case(SolutionDirectory):
     def _execute_probe_postprocess(self, time, region):
         # Execute postProcess in reconstructed case, if processor folders are empty
         if os.path.basename(self.latestDir()) == self.getParallelTimes()[-1]:
-            command = 'postProcess -case {0} -time {1} -func probes -region {2} > {3}/log.probes'
-            os.system(command.format(self.name, time, region, self.name))
+            command = ['postProcess', '-case', self.name, '-time', time, '-func', 'probes', '-region', region]
+            self._execute(*command, logname = 'log.probes')
         # Execute in decomposed case else
         elif len(self.getTimes()) < len(self.getParallelTimes()):
             number_processors = len(self.processorDirs())
-            command = 'mpirun -np {0} postProcess -parallel -case {1} -time {2} -func probes -region {3} > {4}/log.probes'
-            os.system(command.format(number_processors, self.name, time, region, self.name))
+            command = [
+                'mpirun', '-np', number_processors,
+                'postProcess', '-parallel', '-case', self.name, '-time', time, '-func', 'probes', '-region', region
+                ]
+            self._execute(*command, logname = 'log.probes')
         else:
             raise OSError('Can not execute OpenFOAM postProcess utility. Check case for time directories')
 
@@ -902,7 +976,6 @@ class Case(SolutionDirectory):
             [self.add_probe(locations[i,:]) for i in range(locations.shape[0])]
             self._execute_probe_postprocess(time, region)
             self._probes_to_csv(probespath, region)
-            self._move_logs()
             self.clear_probes()
 
     def probe(self, region, location = None, time = None, clear = False):
@@ -935,7 +1008,6 @@ class Case(SolutionDirectory):
         self._execute_probe_postprocess(time, region)
         
         self._probes_to_csv(probespath, region)
-        self._move_logs()
 
     def _probes_to_csv(self, probespath, region):
 
@@ -987,6 +1059,27 @@ class Case(SolutionDirectory):
         controlDict['functions']['wallTemperature_' + battery_name]['region'] = battery_name
         controlDict['functions']['wallTemperature_' + battery_name]['name'] = battery_name + '_to_airInside'
 
+    def _execute(self, command, *args, logname = None):
+        """
+        Execute a script of the case, e.g. Run, or an OpenFOAM utility. The output is written to the logs folder
+        and the timing of the command is appended to the timings of the case.
+        """
+        # Sync point, the command reads the changed dictionaries from disk
+        self.dictionaries.flush()
+
+        logfolder = os.path.join(self.name, 'logs')
+        if logname is None:
+            logname = 'log.' + os.path.basename(command)
+
+        try:
+            runner.run(
+                [command, *args], os.path.join(logfolder, logname),
+                timingfile = os.path.join(logfolder, runner.TIMINGFILE)
+                )
+        finally:
+            # Run functions of the scripts write logs of the applications to the case directory
+            self._move_logs()
+
     def _move_logs(self):
         """Move log. files into logs folder"""
         logfolder = os.path.join(self.name, 'logs')
@@ -1033,18 +1126,17 @@ class Case(SolutionDirectory):
     
     def remove_airInside(self):
         """Remove fluid regions from the case (namely airInside region)"""
-        regionProperties = ParsedParameterFile(os.path.join(self.constantDir(),'regionProperties'))
+        regionProperties = self.dictionaries.get(os.path.join(self.constantDir(),'regionProperties'))
         regionProperties['regions'][1].clear()
-        regionProperties.writeFile()
 
         # Disable function objects for airInside region
-        controlDict = ParsedParameterFile(os.path.join(self.systemDir(), "controlDict"))
+        controlDict = self.dictionaries.get(os.path.join(self.systemDir(), "controlDict"))
         controlDict['functions']['wallHeatFlux']['enabled'] = 'no'
         controlDict['functions']['wallTemperature_airInside']['enabled'] = 'no'
         controlDict['functions']['average_airInside']['enabled'] = 'no'
         controlDict['functions']['min_airInside']['enabled'] = 'no'
         controlDict['functions']['max_airInside']['enabled'] = 'no'
-        controlDict.writeFile()
+        self.dictionaries.flush()
 
     def _setup_arrival(self, ambienttemperature):
         self.remove_airInside()
@@ -1055,7 +1147,7 @@ class Case(SolutionDirectory):
         # Change the changeDictionaryDict for all battery regions
         regions = self.cargo_regions()
         for region in regions:
-            changeDictionaryDict = ParsedParameterFile(
+            changeDictionaryDict = self.dictionaries.get(
                 os.path.join(os.path.join(self.systemDir(), region, 'changeDictionaryDict'))
             )
 
@@ -1067,10 +1159,7 @@ class Case(SolutionDirectory):
             if 'internalField' in changeDictionaryDict['T']:
                 del changeDictionaryDict['T']['internalField']
 
-            changeDictionaryDict.writeFile()
-
-        os.system(os.path.join(self.name,"ChangeDictionarySolid"))
-        self._move_logs()
+        self._execute(os.path.join(self.name, 'ChangeDictionarySolid'))
  
     def _get_max_delta(self, reftemperature, extrem = False):
         """Calculate the maximal temperature difference of all solid regions to a reference temperature"""
@@ -1153,15 +1242,13 @@ class Case(SolutionDirectory):
         while deltaT > max_deltaT:
             print('Temperature difference to ambient temperature: {}'.format(deltaT))
             latesttime = float(self.getParallelTimes()[-1])
-            controlDict = ParsedParameterFile(os.path.join(self.systemDir(), "controlDict"))
+            controlDict = self.dictionaries.get(os.path.join(self.systemDir(), "controlDict"))
             controlDict['endTime'] = latesttime + timestep
             controlDict['writeInterval'] = timestep
-            controlDict.writeFile()
 
             self._change_dictionary_solids(ambienttemperature)
 
-            os.system(os.path.join(self.name,"Run"))
-            self._move_logs()
+            self._execute(os.path.join(self.name, 'Run'))
    
             deltaT, temperature_extrem = self._get_max_delta(ambienttemperature, extrem=True)
 
@@ -1185,18 +1272,7 @@ class Case(SolutionDirectory):
             
 def utcoffset(utc_datetime, lat, lon):
     """Get the offset to UTC time at a specified location"""
-    # Get timezone name
-    tf = timezonefinder.TimezoneFinder()
-    timezone_str = tf.certain_timezone_at(lat=lat, lng=lon)
-    if timezone_str == None:
-        print('Current timezone: No match for location. Probably on sea. Approximating timezone.')
-        #rough approximation can be calculated: 1 hour difference corresponds to 15 degrees longitude (360 / 24).
-        return floor(lon/15)
-
-    print('Current timezone: {}'.format(timezone_str))
-    timezone = pytz.timezone(timezone_str)
-    offset = timezone.utcoffset(utc_datetime).total_seconds()/3600 
-    return offset
+    return timezones.utcoffsets([utc_datetime], [lat], [lon])[0]
 
 def coordinate_transformation(x_axis, cart_vector):
     """
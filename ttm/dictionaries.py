@@ -0,0 +1,155 @@
+import copy
+import filecmp
+import os
+
+from PyFoam.Basics.DataStructures import DictProxy
+from PyFoam.Basics.FoamFileGenerator import FoamFileGenerator
+from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
+
+# Manager shared by all cases of the process
+_manager = None
+
+class Dictionary:
+    """
+    OpenFOAM dictionary parsed by the DictionaryManager.
+
+    Top level entries are compared with their state after the last parse or write when they were
+    accessed, so changes of nested entries, e.g. dictionary['T']['boundaryField'], are tracked as well.
+    """
+    def __init__(self, parsedfile):
+        self.file = parsedfile
+        # Text of the accessed top level entries after the last parse or write, None for new entries
+        self._snapshots = {}
+
+    def _text(self, key):
+        """Entry as written to the file, None if the entry does not exist"""
+        if key not in self.file.content:
+            return None
+        return str(FoamFileGenerator(self.file[key], longListThreshold = self.file.longListOutputThreshold))
+
+    def _snapshot(self, key):
+        if key not in self._snapshots:
+            self._snapshots[key] = self._text(key)
+
+    def __getitem__(self, key):
+        self._snapshot(key)
+        return self.file[key]
+
+    def __setitem__(self, key, value):
+        self._snapshot(key)
+        self.file[key] = value
+
+    def __delitem__(self, key):
+        self._snapshot(key)
+        del self.file[key]
+
+    def __contains__(self, key):
+        return key in self.file.content
+
+    @property
+    def content(self):
+        return self.file.content
+
+    @property
+    def name(self):
+        return self.file.name
+
+    def modified(self):
+        """Top level keys that changed since the last parse or write"""
+        return [key for key, snapshot in self._snapshots.items() if self._text(key) != snapshot]
+
+    def write(self):
+        self.file.writeFile()
+        self._snapshots = {}
+
+class DictionaryManager:
+    """
+    Cache of parsed OpenFOAM dictionaries, each file is parsed once per process.
+
+    Changes are kept in memory and only files with modified entries are written by flush, which is
+    called at the sync points before OpenFOAM utilities read the dictionaries. Files that are changed
+    on disk by other programs, e.g. initial fields by changeDictionary, are parsed again.
+    """
+    def __init__(self):
+        self._files = {}
+        self._stamps = {}
+
+        # Statistics for throughput reports
+        self.parsed = 0
+        self.copied = 0
+        self.written = 0
+
+    def get(self, filepath, like = None):
+        """
+        Parsed dictionary of a file.
+
+        Args:
+            like: file that filepath was copied from, e.g. of a template region, the parsed
+                dictionary of like is copied instead of parsing filepath again if both files are identical
+        """
+        filepath = os.path.abspath(filepath)
+        if filepath in self._files:
+            if _stamp(filepath) == self._stamps[filepath]:
+                return self._files[filepath]
+            if self._files[filepath].modified():
+                raise ValueError('{} was changed on disk and has unsaved changes'.format(filepath))
+
+        source = self.get(like) if like is not None else None
+        if source is not None and not source.modified() and filecmp.cmp(source.name, filepath, shallow = False):
+            parsedfile = _copy(source.file, filepath)
+            self.copied += 1
+        else:
+            parsedfile = ParsedParameterFile(filepath)
+            self.parsed += 1
+
+        self._files[filepath] = Dictionary(parsedfile)
+        self._stamps[filepath] = _stamp(filepath)
+        return self._files[filepath]
+
+    def flush(self):
+        """Write all files with modified entries, returns the written files"""
+        written = []
+        for filepath, dictionary in self._files.items():
+            if dictionary.modified():
+                dictionary.write()
+                self._stamps[filepath] = _stamp(filepath)
+                written.append(filepath)
+        self.written += len(written)
+        return written
+
+    def clear(self):
+        """Forget all parsed files, unsaved changes are lost"""
+        self._files.clear()
+        self._stamps.clear()
+
+def _copy(parsedfile, filepath):
+    """Copy of a parsed file for another file"""
+    copied = copy.deepcopy(parsedfile)
+    copied.name = filepath
+    _copy_comments(parsedfile.content, copied.content)
+    return copied
+
+def _copy_comments(source, target):
+    """PyFoam drops the comments after entries when copying dictionaries, they are copied separately"""
+    if not isinstance(source, DictProxy) or not isinstance(target, DictProxy):
+        return
+    for key, text in source._decoration.items():
+        target.addDecoration(key, text)
+    for key in source._order:
+        if key in source and key in target:
+            _copy_comments(source[key], target[key])
+
+def _stamp(filepath):
+    """Modification time and size of a file, None if the file does not exist"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def manager():
+    """Dictionary manager of the process, created on first use"""
+    global _manager
+    if _manager is None:
+        _manager = DictionaryManager()
+    return _manager
@@ -0,0 +1,210 @@
+import ftplib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+class Downloader:
+    """
+    Downloads files concurrently over a small pool of persistent FTP and HTTP sessions.
+
+    Sessions are reused per host, files are streamed to disk in chunks and
+    partial downloads are resumed after connection errors, with exponential backoff
+    between retries. Works with ftp://, http:// and https:// urls, so a local
+    stand-in server can be used instead of the NOAA servers.
+    """
+    def __init__(self, workers = 4, chunksize = 65536, retries = 4, backoff = 1.0, timeout = 60):
+        self.workers = workers
+        self.chunksize = chunksize
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.executor = ThreadPoolExecutor(max_workers = workers)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+        # Statistics for throughput reports
+        self.downloaded_bytes = 0
+        self.downloaded_files = 0
+        self.failed_files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _pool(self, url):
+        with self._lock:
+            return self._sessions.setdefault((url.scheme, url.netloc), queue.LifoQueue())
+
+    def _acquire(self, url):
+        """Get an idle session for the host of url or connect a new one"""
+        try:
+            return self._pool(url).get_nowait()
+        except queue.Empty:
+            return self._connect(url)
+
+    def _release(self, url, session):
+        self._pool(url).put(session)
+
+    def _connect(self, url):
+        if url.scheme == 'ftp':
+            session = ftplib.FTP(timeout = self.timeout)
+            session.connect(url.hostname, url.port or 21)
+            session.login(url.username or 'anonymous', url.password or '')
+        else:
+            session = requests.Session()
+        return session
+
+    def _discard(self, session):
+        try:
+            session.close()
+        except (OSError, EOFError):
+            pass
+
+    def get_text(self, fileurl: str):
+        """Read a text resource, e.g. a directory listing, with a pooled HTTP session"""
+        url = urlparse(fileurl)
+        session = self._acquire(url)
+        try:
+            r = session.get(fileurl, timeout = self.timeout, allow_redirects = True)
+            r.raise_for_status()
+        except requests.RequestException:
+            self._discard(session)
+            raise
+        self._release(url, session)
+        return r.text
+
+    def fetch(self, fileurl: str, targetpath: str):
+        """
+        Download fileurl to targetpath. Existing files are not downloaded again.
+
+        Returns:
+            True if the file is available at targetpath
+        """
+        if os.path.exists(targetpath):
+            return True
+
+        os.makedirs(os.path.dirname(os.path.abspath(targetpath)), exist_ok = True)
+        url = urlparse(fileurl)
+        partpath = targetpath + '.part'
+
+        for attempt in range(self.retries + 1):
+            session = None
+            try:
+                session = self._acquire(url)
+                if url.scheme == 'ftp':
+                    self._fetch_ftp(session, url, partpath)
+                else:
+                    self._fetch_http(session, fileurl, partpath)
+                self._release(url, session)
+                os.replace(partpath, targetpath)
+                with self._lock:
+                    self.downloaded_files += 1
+                return True
+
+            # File does not exist on the server, retrying does not help
+            except ftplib.error_perm as e:
+                if session is not None:
+                    self._release(url, session)
+                print('Download of {0} failed: {1}'.format(fileurl, e))
+                break
+            except requests.HTTPError as e:
+                if session is not None:
+                    self._release(url, session)
+                print('Download of {0} failed: {1}'.format(fileurl, e))
+                if e.response is not None and 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                    break
+
+            # Connection problems, partial file is kept and resumed
+            except (ftplib.all_errors + (requests.RequestException,)) as e:
+                if session is not None:
+                    self._discard(session)
+                print('Download of {0} failed: {1}'.format(fileurl, e))
+
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+
+        if os.path.exists(partpath):
+            os.remove(partpath)
+        with self._lock:
+            self.failed_files += 1
+        return False
+
+    def _write(self, fh):
+        """Return callback that writes chunks to fh and counts downloaded bytes"""
+        def write(chunk):
+            fh.write(chunk)
+            with self._lock:
+                self.downloaded_bytes += len(chunk)
+        return write
+
+    def _fetch_ftp(self, session: ftplib.FTP, url, partpath: str):
+        offset = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+        with open(partpath, 'ab') as fh:
+            session.retrbinary(
+                'RETR ' + url.path, self._write(fh), blocksize = self.chunksize, rest = offset or None
+                )
+
+    def _fetch_http(self, session: requests.Session, fileurl: str, partpath: str):
+        offset = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+        headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+
+        with session.get(fileurl, headers = headers, stream = True, timeout = self.timeout, allow_redirects = True) as r:
+            # Requested range starts at end of file, partial download is already complete
+            if r.status_code == 416:
+                return
+            r.raise_for_status()
+            # Server ignored the range request, download from start
+            mode = 'ab' if r.status_code == 206 else 'wb'
+            with open(partpath, mode) as fh:
+                write = self._write(fh)
+                for chunk in r.iter_content(chunk_size = self.chunksize):
+                    write(chunk)
+
+    def fetch_all(self, jobs):
+        """
+        Download many files concurrently.
+
+        Args:
+            jobs: list of (fileurl, targetpath) tuples
+
+        Returns:
+            list with success of each job
+        """
+        missing = [job for job in jobs if not os.path.exists(job[1])]
+        if missing:
+            print('Downloading {} files'.format(len(missing)))
+            start = time.time()
+            bytes_start = self.downloaded_bytes
+            results = list(self.executor.map(lambda job: self.fetch(*job), missing))
+            self.report(
+                self.downloaded_bytes - bytes_start, time.time() - start, results.count(True), results.count(False)
+                )
+
+        return [os.path.exists(targetpath) for _, targetpath in jobs]
+
+    def report(self, size: int, seconds: float, files: int, failed = 0):
+        """Print throughput of downloads"""
+        megabytes = size / 1e6
+        print(
+            'Downloaded {0} files ({1:.1f} MB) in {2:.1f} s: {3:.2f} MB/s{4}'.format(
+                files, megabytes, seconds, megabytes / max(seconds, 1e-9),
+                ', {} failed'.format(failed) if failed else ''
+                ))
+
+    def close(self):
+        """Close all pooled sessions and stop the workers"""
+        self.executor.shutdown()
+        with self._lock:
+            pools = list(self._sessions.values())
+            self._sessions = {}
+        for pool in pools:
+            while not pool.empty():
+                self._discard(pool.get_nowait())
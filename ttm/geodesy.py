@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+# Mean earth radius in m
+EARTH_RADIUS = 6371008.8
+# Semi-major axis in m and flattening of the WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+def haversine(lat_start, lon_start, lat_end, lon_end):
+    """Great circle distance in m between arrays of coordinates on a sphere"""
+    lat_start, lon_start, lat_end, lon_end = map(np.radians, (lat_start, lon_start, lat_end, lon_end))
+    a = np.sin((lat_end - lat_start) / 2)**2 + np.cos(lat_start) * np.cos(lat_end) * np.sin((lon_end - lon_start) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def vincenty(lat_start, lon_start, lat_end, lon_end, iterations = 200, tolerance = 1e-12):
+    """
+    Distance in m between arrays of coordinates on the WGS-84 ellipsoid with Vincenty's inverse formula.
+    All pairs are iterated at once, nearly antipodal pairs that do not converge use the haversine distance.
+    """
+    a, f = WGS84_A, WGS84_F
+    b = (1 - f) * a
+    lat_start, lon_start, lat_end, lon_end = np.broadcast_arrays(*(
+        np.radians(np.asarray(value, dtype = float)) for value in (lat_start, lon_start, lat_end, lon_end)
+        ))
+
+    U1 = np.arctan((1 - f) * np.tan(lat_start))
+    U2 = np.arctan((1 - f) * np.tan(lat_end))
+    sinU1, cosU1, sinU2, cosU2 = np.sin(U1), np.cos(U1), np.sin(U2), np.cos(U2)
+    L = (lon_end - lon_start + np.pi) % (2 * np.pi) - np.pi
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype = bool)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        for _ in range(iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            # Coincident points have no direction
+            sin_alpha = np.where(sin_sigma == 0, 0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha**2
+            # Lines along the equator
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_next = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m**2))
+                )
+            converged = np.abs(lam_next - lam) <= tolerance
+            lam = lam_next
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (a**2 - b**2) / b**2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)
+            ))
+        distance = b * A * (sigma - delta_sigma)
+
+    fallback = ~converged | np.isnan(distance)
+    if fallback.any():
+        distance = np.where(
+            fallback, haversine(*(np.degrees(value) for value in (lat_start, lon_start, lat_end, lon_end))), distance
+            )
+    return distance
+
+def bearing(lat_start, lon_start, lat_end, lon_end):
+    """Initial bearing in degrees clockwise from north between arrays of coordinates"""
+    lat_start, lon_start, lat_end, lon_end = map(np.radians, (lat_start, lon_start, lat_end, lon_end))
+    x = np.sin(lon_end - lon_start) * np.cos(lat_end)
+    y = np.cos(lat_start) * np.sin(lat_end) - np.sin(lat_start) * np.cos(lat_end) * np.cos(lon_end - lon_start)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+def elapsed_seconds(dates):
+    """Seconds passed since the first of the dates"""
+    dates = pd.DatetimeIndex(dates)
+    return ((dates - dates[0]) / pd.Timedelta(seconds = 1)).to_numpy(dtype = float)
+
+def kinematics(dates, lat, lon):
+    """
+    Distance in m, travel speed in m/s and heading in degrees of the segments starting at each waypoint.
+    The last waypoint ends the route and has no segment, its distance and speed are zero.
+    """
+    seconds = elapsed_seconds(dates)
+    lat = np.asarray(lat, dtype = float)
+    lon = np.asarray(lon, dtype = float)
+
+    durations = np.diff(seconds)
+    distances = np.append(vincenty(lat[:-1], lon[:-1], lat[1:], lon[1:]), 0)
+    speeds = np.zeros(len(seconds))
+    np.divide(distances[:-1], durations, out = speeds[:-1], where = durations > 0)
+    headings = np.append(bearing(lat[:-1], lon[:-1], lat[1:], lon[1:]), np.nan)
+
+    return {'seconds': seconds, 'segment_distance': distances, 'speed': speeds, 'heading': headings}
+
+def add_kinematics(dataframe):
+    """Add columns with the kinematics of the segments to a dataframe with Date, Lat and Lon columns"""
+    values = kinematics(dataframe['Date'], dataframe['Lat'].values, dataframe['Lon'].values)
+    for column in ['segment_distance', 'speed', 'heading']:
+        dataframe[column] = values[column]
+    return dataframe
@@ -1,48 +1,80 @@
-import gpxpy 
+import xml.etree.ElementTree as ElementTree
+
 import numpy as np
 import pandas as pd
 
+# Initial number of points of the arrays, the arrays are doubled for longer tracks
+CAPACITY = 65536
+
+def _localname(tag):
+    """Tag without the namespace of the gpx version"""
+    return tag.rpartition('}')[2]
+
+def _empty(size):
+    return np.empty(size, dtype = object), np.empty(size), np.empty(size)
+
+def _grow(array, size):
+    grown = np.empty(size, dtype = array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def _chunk(times, lat, lon, count):
+    """Arrays of the first count points, the ISO 8601 times are converted to naive UTC datetimes"""
+    dates = pd.DatetimeIndex(pd.to_datetime(times[:count], utc = True, format = 'ISO8601'))
+    return dates.tz_localize(None).values.astype('datetime64[ns]'), lat[:count], lon[:count]
+
+def read(filename, chunksize = None):
+    """
+    Stream the track points of a gpx file into arrays. The file is parsed incrementally
+    and processed points are removed from the tree, so the memory use does not grow with
+    the size of the file.
+
+    Args:
+        chunksize: yield arrays of at most chunksize points, all points at once if None
+
+    Yields:
+        times as naive UTC datetime64, latitudes and longitudes of the track points
+    """
+    size = chunksize or CAPACITY
+    times, lat, lon = _empty(size)
+    count = 0
+    chunks = 0
+
+    parents = []
+    for event, element in ElementTree.iterparse(filename, events = ('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if _localname(element.tag) != 'trkpt':
+            continue
+
+        if count == size:
+            if chunksize:
+                yield _chunk(times, lat, lon, count)
+                chunks += 1
+                times, lat, lon = _empty(size)
+                count = 0
+            else:
+                size *= 2
+                times, lat, lon = _grow(times, size), _grow(lat, size), _grow(lon, size)
+
+        lat[count] = float(element.get('lat'))
+        lon[count] = float(element.get('lon'))
+        times[count] = next((child.text for child in element if _localname(child.tag) == 'time'), None)
+        count += 1
+
+        parents[-1].remove(element)
+
+    if count or not chunks:
+        yield _chunk(times, lat, lon, count)
+
 def coordinates(filename):
     """Reads coordinates from gpx file"""
-    amount_points = 0
-    counter_points = 0
-
-    # Open and parse gpx file
-    gpx_file = open(filename, 'r') 
-    gpx = gpxpy.parse(gpx_file)
-
-    # Preallocate memory for coordinates
-    for track in gpx.tracks: 
-        for segment in track.segments: 
-            for point in segment.points: 
-                    amount_points = amount_points + 1
-    coordinates = np.zeros([amount_points, 2])
-
-    # Fill coordinates array
-    for track in gpx.tracks: 
-        for segment in track.segments: 
-            for point in segment.points: 
-                coordinates[counter_points, :] = [point.latitude, point.longitude]
-                counter_points = counter_points + 1
-    
-    return coordinates
+    _, lat, lon = next(read(filename))
+    return np.column_stack((lat, lon))
 
 def dataframe(filename):
-    """Reads point time and position as pandas dataframe"""
-    # Open and parse gpx file
-    gpx_file = open(filename, 'r') 
-    gpx = gpxpy.parse(gpx_file)
-
-    df_list = []
-    for track in gpx.tracks: 
-        for segment in track.segments: 
-            for point in segment.points: 
-                    data = {
-                        'Date': [point.time],
-                        'Lat': [point.latitude],
-                        'Lon': [point.longitude]
-                    }
-                    df = pd.DataFrame(data = data, columns = ['Date', 'Lat', 'Lon'])
-                    df_list.append(df)
-
-    return pd.concat(df_list)
\ No newline at end of file
+    """Reads point time and position as pandas dataframe, times are naive UTC"""
+    times, lat, lon = next(read(filename))
+    return pd.DataFrame({'Date': times, 'Lat': lat, 'Lon': lon})
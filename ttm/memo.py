@@ -0,0 +1,131 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from ttm import cache
+
+# Size of the cells in degrees, waypoints in the same cell and hour share their temperature
+CELLSIZE = 0.1
+# Cache sources whose time to live applies to the memoized values, by the name of the source before
+# its parameters, e.g. isd-idw-gap3
+SOURCES = {'isd': 'isd-lite', 'icoads': 'icoads', 'oisst': 'oisst'}
+# Separator of a source and the sources tried before it in the memo key, e.g. oisst/isd-gap3/icoads
+SEPARATOR = '/'
+
+def keys(sources):
+    """
+    Memo keys of sources that are tried in order. Values of a fallback source are keyed with the
+    sources tried before it, so they are only used by providers that try the same sources first.
+    """
+    return [SEPARATOR.join([source] + sources[:i]) for i, source in enumerate(sources)]
+
+def ttl(key):
+    """Shortest time to live of the sources in a memo key, None if no source expires"""
+    ttls = [cache.TTLS.get(SOURCES.get(source.split('-')[0])) for source in key.split(SEPARATOR)]
+    ttls = [value for value in ttls if value is not None]
+    return min(ttls) if ttls else None
+
+class WaypointMemo:
+    """
+    Table of resolved waypoint temperatures shared by all transports.
+
+    Values are keyed by UTC hour, quantized lat/lon cell and source of the value together with the
+    sources tried before it, and saved in a sqlite database in the cache. Values expire with the
+    shortest time to live of these sources in the cache.
+    """
+    def __init__(self, filepath = None):
+        self.filepath = filepath or cache.path('memo', 'waypoints.sqlite')
+        self.connection = sqlite3.connect(self.filepath, timeout = 60)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS waypoints (
+                hour INTEGER, lat INTEGER, lon INTEGER, source TEXT,
+                T REAL, distance REAL, created REAL,
+                PRIMARY KEY (hour, lat, lon, source)
+                ) WITHOUT ROWID"""
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def cells(lat, lon):
+        """Indices of the cells containing the coordinates"""
+        index_lat = np.floor(np.asarray(lat, dtype=float) / CELLSIZE).astype(np.int64)
+        index_lon = np.floor(np.mod(np.asarray(lon, dtype=float), 360) / CELLSIZE).astype(np.int64)
+        return index_lat, index_lon
+
+    def lookup(self, hours, lat, lon, sources):
+        """
+        Find memoized values for waypoints given by hours since epoch and coordinates.
+        If a waypoint has values of several sources, the first source in sources is used.
+
+        Args:
+            sources: memo keys of the sources, see keys
+
+        Returns:
+            temperatures, distances and sources, NaN and None for waypoints without value
+        """
+        index_lat, index_lon = self.cells(lat, lon)
+        temperatures = np.full(len(hours), np.nan)
+        distances = np.full(len(hours), np.nan)
+        found_sources = np.full(len(hours), None, dtype=object)
+
+        now = time.time()
+        priority = {source: rank for rank, source in enumerate(sources)}
+        ranks = np.full(len(hours), len(sources))
+
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS query (i INTEGER, hour INTEGER, lat INTEGER, lon INTEGER)')
+        self.connection.execute('DELETE FROM query')
+        self.connection.executemany(
+            'INSERT INTO query VALUES (?, ?, ?, ?)',
+            zip(range(len(hours)), map(int, hours), map(int, index_lat), map(int, index_lon))
+            )
+        rows = self.connection.execute(
+            """SELECT query.i, waypoints.source, waypoints.T, waypoints.distance, waypoints.created
+            FROM query JOIN waypoints USING (hour, lat, lon)"""
+            )
+        for i, source, T, distance, created in rows:
+            if source not in priority or priority[source] >= ranks[i]:
+                continue
+            expires = ttl(source)
+            if expires is not None and now - created > expires:
+                continue
+            ranks[i] = priority[source]
+            temperatures[i] = T
+            distances[i] = distance
+            found_sources[i] = source
+
+        hits = np.count_nonzero(found_sources != None)
+        self.hits += hits
+        self.misses += len(hours) - hits
+
+        return temperatures, distances, found_sources
+
+    def store(self, hours, lat, lon, sources, temperatures, distances):
+        """Save resolved values of waypoints, waypoints without value are skipped"""
+        index_lat, index_lon = self.cells(lat, lon)
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO waypoints VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (int(hours[i]), int(index_lat[i]), int(index_lon[i]), sources[i],
+                    float(temperatures[i]), float(distances[i]), now)
+                    for i in range(len(hours)) if sources[i] is not None and not np.isnan(temperatures[i])
+                ])
+
+    def report(self):
+        """Print hit and miss statistics of this memo"""
+        total = self.hits + self.misses
+        print('Waypoint memo: {0} hits, {1} misses ({2:.0%} hit rate)'.format(
+            self.hits, self.misses, self.hits / total if total else 0
+            ))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,237 @@
+import asyncio
+from urllib.parse import urlparse
+
+import numpy as np
+
+from ttm import cache
+from ttm import weather
+from ttm.memo import WaypointMemo
+
+# Concurrent downloads per remote host
+HOST_CONCURRENCY = 8
+# Threads parsing downloaded files
+PARSE_WORKERS = 4
+# Size of the queues between the stages, a stage waits if the next stage falls behind
+QUEUESIZE = 32
+
+class WeatherPipeline:
+    """
+    Asynchronous version of the weather gathering with the NOAA provider.
+
+    The waypoints pass the stages station resolution, download, parse and value extraction.
+    Downloads and parsing are connected by bounded queues and run concurrently in threads,
+    the number of concurrent downloads is limited per remote host. Progress is reported as
+    events, dicts with the keys stage, step, item, done and total, to the progress callback.
+    The pipeline is stopped by cancelling the task awaiting it.
+    """
+    def __init__(self, provider = None, progress = None, host_concurrency = HOST_CONCURRENCY, queuesize = QUEUESIZE):
+        self.provider = provider or weather.NOAAProvider()
+        self.progress = progress
+        self.host_concurrency = host_concurrency
+        self.queuesize = queuesize
+        self._semaphores = {}
+
+    def _emit(self, stage: str, **event):
+        if self.progress is not None:
+            self.progress(dict(stage = stage, **event))
+
+    def _semaphore(self, fileurl: str):
+        """Semaphore limiting the concurrent downloads from the host of fileurl"""
+        host = urlparse(fileurl).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        return self._semaphores[host]
+
+    async def _blocking(self, function, *args):
+        """Run a blocking function in a thread"""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _stages(self, stage: str, items, parse):
+        """
+        Download and parse files concurrently.
+
+        Args:
+            items: list of (key, fileurl, targetpath), fileurl is None for cached files
+            parse: blocking function returning the parsed file for a key
+
+        Returns:
+            dict of the parsed files by key, files that could not be downloaded are missing
+        """
+        downloads = asyncio.Queue(self.queuesize)
+        parsing = asyncio.Queue(self.queuesize)
+        results = {}
+        errors = []
+        counts = {'download': 0, 'parse': 0}
+        total = len(items)
+
+        async def download_worker():
+            while True:
+                key, fileurl, targetpath = await downloads.get()
+                try:
+                    success = True
+                    if fileurl is not None:
+                        async with self._semaphore(fileurl):
+                            success = await self._blocking(weather.get_downloader().fetch, fileurl, targetpath)
+                        counts['download'] += 1
+                        self._emit(
+                            stage, step = 'download', item = key, success = success,
+                            done = counts['download'], total = total
+                            )
+                    # Parsing a file that failed would download it again with all retries
+                    if success:
+                        await parsing.put(key)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    downloads.task_done()
+
+        async def parse_worker():
+            while True:
+                key = await parsing.get()
+                try:
+                    results[key] = await self._blocking(parse, key)
+                    counts['parse'] += 1
+                    self._emit(stage, step = 'parse', item = key, done = counts['parse'], total = total)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    parsing.task_done()
+
+        hosts = {urlparse(fileurl).netloc for _, fileurl, _ in items if fileurl is not None}
+        workers = [
+            asyncio.create_task(download_worker()) for _ in range(max(len(hosts), 1) * self.host_concurrency)
+            ] + [asyncio.create_task(parse_worker()) for _ in range(PARSE_WORKERS)]
+        try:
+            for item in items:
+                await downloads.put(item)
+            await downloads.join()
+            await parsing.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions = True)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    async def temperatures(self, datetimes, lat, lon):
+        """Get temperatures and distances for many waypoints, see NOAAProvider"""
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        provider = self.provider
+
+        # Other providers do not download, they are only moved out of the event loop
+        if not isinstance(provider, weather.NOAAProvider):
+            return await self._blocking(provider.temperatures, datetimes, lat, lon)
+
+        with WaypointMemo() as memo:
+            result = provider._lookup(memo, datetimes, lat, lon)
+            self._emit('memo', step = 'lookup', done = len(datetimes) - result['todo'].size, total = len(datetimes))
+
+            if result['todo'].size:
+                await self._isd(result, datetimes, lat, lon)
+
+            # Use reports of ships nearby for waypoints without weather station nearby
+            if provider.use_ICOADS:
+                months = provider._missing(result, datetimes, '%Y%m')
+                reports = await self._files('icoads', weather.ICOADSFile, months, datetimes)
+                for key, rows in months.items():
+                    if key in reports:
+                        provider._icoads(reports[key], result, datetimes, lat, lon, rows)
+
+            # Use sea surface temperature for remaining waypoints
+            days = provider._missing(result, datetimes, '%Y%m%d')
+            sst = await self._files('oisst', weather.OISSTFile, days, datetimes, opener = weather.OISSTFile.open)
+            for key, rows in days.items():
+                if key in sst:
+                    provider._oisst(sst[key], result, lat, lon, rows)
+
+            provider._store(memo, result, lat, lon)
+            self._emit('done', step = 'done', done = len(datetimes), total = len(datetimes))
+
+        return result['temperatures'], result['distances']
+
+    async def _isd(self, result, datetimes, lat, lon):
+        """Resolve waypoints with ISD stations, station-year files of each round are downloaded concurrently"""
+        isd = await self._blocking(weather.ISD, self.provider.max_gap)
+        # Stations whose files could not be downloaded are skipped, as in ISD.station_year
+        empty = weather.StationYear.empty()
+        todo = result['todo']
+        dates = [weather.hour_rounder(datetimes[i]) for i in todo]
+        hours = weather.epoch_hours(dates)
+        lat_todo, lon_todo = lat[todo], lon[todo]
+        temperatures = np.full(len(todo), np.nan)
+        distances = np.full(len(todo), np.nan)
+
+        groups = isd._groups(dates, lat_todo, lon_todo)
+
+        # Files of all candidate stations are needed for blending
+        if self.provider.interpolation is not None:
+            series = await self._stations(isd, isd._candidate_files(groups))
+            temperatures, distances = isd._blend(
+                groups, hours, self.provider.stations, self.provider.interpolation, 
+                lambda filename, year: series.get((filename, year), empty)
+                )
+
+        while self.provider.interpolation is None and any(group['pending'].size for group in groups):
+            files = isd._next_round(groups, lat_todo, lon_todo)
+            series = await self._stations(isd, files)
+            for group in groups:
+                isd._evaluate(
+                    group, hours, temperatures, distances, lambda filename, year: series.get((filename, year), empty)
+                    )
+
+        result['temperatures'][todo] = temperatures
+        result['distances'][todo] = distances
+        self.provider._found(result, todo, self.provider.isd_source)
+
+    async def _stations(self, isd, files):
+        """Download and parse station-year files, given as set of (filename, year)"""
+        fileurls = {targetpath: fileurl for fileurl, targetpath in isd.jobs(files)}
+        items = [
+            ((filename, year), fileurls.get(isd._filepath(filename)), isd._filepath(filename))
+            for filename, year in files
+            ]
+        return await self._stages('isd', items, lambda key: isd.station_year(*key, ftp = True))
+
+    async def _files(self, stage: str, cls, groups, datetimes, opener = None):
+        """
+        Download and open the NOAA files of cls for groups of waypoints, files are returned by group key.
+        The files are opened with opener for a date, by default cls.
+        """
+        opener = opener or cls
+        dates = {key: datetimes[rows[0]] for key, rows in groups.items()}
+        # Directory listings are read in threads
+        await self._blocking(cls.jobs, list(dates.values()))
+
+        items = []
+        for key, input_date in dates.items():
+            fileurl = cls.fileurl(input_date)
+            # No file for this date on the server
+            if fileurl is None:
+                continue
+            targetpath = cls.targetpath(input_date, fileurl)
+            items.append((key, None if cache.fresh(targetpath) else fileurl, targetpath))
+
+        return await self._stages(stage, items, lambda key: opener(dates[key]))
+
+async def waypoints_temperature(datetimes, lat, lon, provider = None, progress = None):
+    """Awaitable version of weather.waypoints_temperature"""
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+
+    pipeline = WeatherPipeline(provider = provider, progress = progress)
+    temperatures, distances = await pipeline.temperatures(datetimes, lat, lon)
+
+    found = ~np.isnan(temperatures)
+    print('Found temperature data for {0} of {1} waypoints'.format(np.count_nonzero(found), found.size))
+    for i in np.flatnonzero(~found):
+        print(
+            "Did not find temperature data for {0} at {1}, {2}".format(
+                datetimes[i], round(lat[i], 3), round(lon[i], 3)
+                ))
+
+    cache.prune()
+
+    return np.around(temperatures, 2), distances
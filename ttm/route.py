@@ -2,18 +2,25 @@ from copy import deepcopy
 from dateutil.parser import parse as dateutilparser
 from datetime import datetime, timedelta 
 import json
+import hashlib
 from math import sqrt, floor
 import os
 import urllib.request
 from urllib.parse import quote
 
-import geopy.distance
 import numpy as np
 import pandas as pd
 
+from ttm import cache
+from ttm import geodesy
 import ttm.gps as gps
 from ttm.weather import onsea
 
+# FTM routing service, can be replaced by a local stand-in server
+ROUTING_URL = os.environ.get('TTM_ROUTING_URL', 'http://gis.ftm.mw.tum.de/route')
+# Speed in m/s below which the heading of a segment is ignored
+MIN_SPEED = 0.5
+
 class FTMRoute:
     def __init__(self, start_coordinates, end_coordinates, stops = []):
         route = self._routing(start_coordinates, end_coordinates)
@@ -91,6 +98,36 @@ class FTMRoute:
         return pd.DataFrame(waypoints_list)
 
     def _routing(self, start_coordinates, end_coordinates):
+        """
+        Get route between two coordinates. Responses of the routing service are cached 
+        as arrays, keyed by the coordinate pair and the url of the service.
+        """
+        key = '{0}?{1:.6f},{2:.6f};{3:.6f},{4:.6f}'.format(
+            ROUTING_URL, start_coordinates[0], start_coordinates[1], end_coordinates[0], end_coordinates[1]
+            )
+        routepath = cache.path('routing', hashlib.sha1(key.encode()).hexdigest() + '.npz')
+
+        if cache.fresh(routepath):
+            arrays = np.load(routepath)
+        else:
+            route = self._request_route(start_coordinates, end_coordinates)
+            arrays = {
+                'coordinates': np.array(route['geometry']['coordinates'], dtype=float),
+                'durations': np.array(route['legs'][0]['annotation']['duration'], dtype=float),
+                'distance': np.array(route['distance'], dtype=float),
+                'duration': np.array(route['duration'], dtype=float)
+                }
+            np.savez(routepath, **arrays)
+
+        # Same structure as the response of the routing service
+        return {
+            'distance': float(arrays['distance']),
+            'duration': float(arrays['duration']),
+            'geometry': {'coordinates': arrays['coordinates'].tolist()},
+            'legs': [{'annotation': {'duration': arrays['durations'].tolist()}}]
+            }
+
+    def _request_route(self, start_coordinates, end_coordinates):
         """
         Use FTM routing service. Needs connection to LRZ.
         See also: https://wiki.tum.de/display/smartemobilitaet/Routing
@@ -99,26 +136,22 @@ class FTMRoute:
         lat = []
         lon = []
 
-        lat.append(start_coordinates[0])
-        lat.append(end_coordinates[0])
+        lat.append(float(start_coordinates[0]))
+        lat.append(float(end_coordinates[0]))
 
-        lon.append(start_coordinates[1])
-        lon.append(end_coordinates[1])
+        lon.append(float(start_coordinates[1]))
+        lon.append(float(end_coordinates[1]))
 
         lon = quote(str(lon), safe='')
         lat = quote(str(lat), safe='')
 
-        url = "http://gis.ftm.mw.tum.de/route?lat={0}&lon={1}"
+        url = ROUTING_URL + "?lat={0}&lon={1}"
         try:
             contents = urllib.request.urlopen(url.format(lat, lon)).read()
             route = json.loads(contents)
         except:
             raise Exception('No connection to FTM routing service: Connect to LRZ VPN and try again')
         
-        # np.savetxt("route.csv",  
-        #    route['routes'][0]['geometry']['coordinates'],
-        #    delimiter =", ",  
-        #    fmt ='% s')
         return route['routes'][0]
 
     def _add_hourly_waypoints(self, waypoints_list, date, start_coordinates, end_coordinates):
@@ -163,18 +196,9 @@ class FileRoute:
         self.trimend = trimend
         self.timezone = timezone
 
-        if filename.endswith('.csv'):
-            self.dataframe = self.dataframe_from_csv(filename)
-        elif filename.endswith('.gpx'):
-            # Cache the coordinates in csv format for faster access
-            csvpath = os.path.splitext(filename)[0] + '.csv'
-            if os.path.exists(csvpath):
-                self.dataframe = self.dataframe_from_csv(csvpath)
-            else:
-                self.dataframe = gps.dataframe(filename)
-                self.dataframe.to_csv(csvpath, encoding='utf-8', index=False)
-        else:
+        if not filename.endswith(('.csv', '.gpx')):
             raise ValueError('Supported file formats for routes are gpx or csv')
+        self.dataframe = self.cached_dataframe(filename)
     
         self.start = self.dataframe['Date'].iloc[0]
         self.end = self.dataframe['Date'].iloc[-1]
@@ -183,17 +207,69 @@ class FileRoute:
         self.start += self.trimstart
         self.end -= self.trimend
 
-        self.dataframe = self.dataframe[self.dataframe.Date.between(self.start, self.end)]
+        # Contiguous rows are selected as slice, so the columns stay memory-mapped
+        rows = np.flatnonzero(self.dataframe.Date.between(self.start, self.end).values)
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            self.dataframe = self.dataframe.iloc[rows[0]:rows[-1] + 1]
+        else:
+            self.dataframe = self.dataframe.iloc[rows]
         self.dataframe.index = range(len(self.dataframe))
 
     def traveltime(self):
         traveltime = self.dataframe['Date'].iloc[-1] - self.dataframe['Date'].iloc[0]
         return traveltime.total_seconds()
 
+    def cached_dataframe(self, filename: str):
+        """
+        Positions of the route file from a columnar cache with dates as nanoseconds since epoch.
+        The columns are memory-mapped, not copied into the dataframe. They are rebuilt if the size
+        of the route file changed or if its modification time and its content changed, files with
+        unchanged size and modification time are not hashed again.
+        """
+        key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:8]
+        directory = cache.path('routes', '{0}-{1}'.format(os.path.basename(filename), key))
+        sourcepath = os.path.join(directory, 'source.json')
+        stat = os.stat(filename)
+
+        source = None
+        if cache.fresh(directory) and os.path.exists(sourcepath):
+            with open(sourcepath) as f:
+                source = json.load(f)
+
+        if source is None or source['size'] != stat.st_size \
+                or (source['mtime'] != stat.st_mtime and source['sha1'] != cache.checksum(filename)):
+            if filename.endswith('.gpx'):
+                dataframe = gps.dataframe(filename)
+            else:
+                dataframe = self.dataframe_from_csv(filename)
+            os.makedirs(directory, exist_ok = True)
+            np.save(os.path.join(directory, 'Date.npy'), dataframe['Date'].values.astype('datetime64[ns]').astype(np.int64))
+            np.save(os.path.join(directory, 'Lat.npy'), dataframe['Lat'].values.astype(np.float64))
+            np.save(os.path.join(directory, 'Lon.npy'), dataframe['Lon'].values.astype(np.float64))
+            source = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': cache.checksum(filename)}
+        elif source['mtime'] != stat.st_mtime:
+            # Same content with a new modification time, e.g. a copied file
+            source['mtime'] = stat.st_mtime
+        else:
+            source = None
+
+        # Source is written last, so it only exists for complete columns
+        if source is not None:
+            with open(sourcepath, 'w') as f:
+                json.dump(source, f)
+
+        columns = {key: np.load(os.path.join(directory, key + '.npy'), mmap_mode = 'r') for key in ['Date', 'Lat', 'Lon']}
+        columns['Date'] = columns['Date'].view('datetime64[ns]')
+        return pd.DataFrame(columns, copy = False)
+
     def dataframe_from_csv(self, csvpath):
-        return pd.read_csv(
+        dataframe = pd.read_csv(
                 csvpath, header = 0, usecols=[0, 1, 2], names=['Date', 'Lat', 'Lon'], parse_dates = ['Date']
                 )
+        # Dates with UTC offset, e.g. in files written by earlier versions, are converted to naive UTC like gpx dates
+        if dataframe['Date'].dt.tz is not None:
+            dataframe['Date'] = dataframe['Date'].dt.tz_convert('UTC').dt.tz_localize(None)
+        return dataframe
 
     def waypoints(self, start = None):
         """Get dataframe with hourly waypoints along route
@@ -219,50 +295,79 @@ class FileRoute:
         return waypoints
 
     def _create_waypoints(self):
-
-        waypoints_list = []
-
-        waypoints_list.append(self.dataframe.head(1))
-        waypoints_list[0].at[0,'Lon'] = normalize_longitude(waypoints_list[0].at[0,'Lon'])
-            
-        timestamp = self.start
+        """
+        Resample the positions of the route to hourly waypoints. A position is kept as waypoint
+        if it is more than an hour after the previous waypoint, the gap to the previous position
+        is filled with evenly spaced waypoints. Positions have to be sorted by date.
+        """
+        hour = 3600 * 10**9
+        dates = pd.DatetimeIndex(self.dataframe['Date'])
+        times = dates.as_unit('ns').asi8
+        lat = self.dataframe['Lat'].to_numpy(dtype = float)
+        lon = self.dataframe['Lon'].to_numpy(dtype = float)
+        end = pd.Timestamp(self.end).as_unit('ns').value
+
+        # Select the kept positions, only the waypoints are visited instead of every position
+        kept, previous = [], []
+        timestamp = pd.Timestamp(self.start).as_unit('ns').value
         i = 1
-        while (self.end - timestamp) > timedelta(hours = 1):
-            nexttimestamp = self.dataframe.loc[i, 'Date']
-
-            timedelta_nextpoint = nexttimestamp - timestamp
-
-            # Loop over dataframe until latesttime is reached
-            if timedelta_nextpoint > timedelta(hours = 1): 
-                # Create a vector between next two points, curvature of earth is neglected due to short distances
-                current_coordinates = self.dataframe.loc[i - 1, ['Lat', 'Lon']].values
-                next_coordinates = self.dataframe.loc[i, ['Lat', 'Lon']].values
-                direction = direction_crossover(current_coordinates, next_coordinates)
-
-                # Create waypoints for every hour along the direction
-                number_points = floor(timedelta_nextpoint / timedelta(hours = 1))
-                step = direction/number_points
-                timestep = timedelta_nextpoint / number_points
-                timestep.microsecond = 0
-
-                for j in range(number_points-1):
-                    df_dict = {
-                        'Date':  (timestamp + (j + 1)*timestep).replace(microsecond = 0, nanosecond = 0),
-                        'Lat': current_coordinates[0] + (j + 1)*step[0],
-                        'Lon': normalize_longitude(current_coordinates[1] + (j+1)*step[1])
-                    }
-                    df = pd.DataFrame(df_dict, index = [0])
-                    waypoints_list.append(df)
-
-                waypoints_list.append(self.dataframe.loc[[i], :])
-                waypoints_list[-1].at[i,'Lon'] = normalize_longitude(waypoints_list[-1].at[i,'Lon'])
-                timestamp = self.dataframe['Date'].iloc[i]
-
+        while end - timestamp > hour:
+            i = max(i, np.searchsorted(times, timestamp + hour, side = 'right'))
+            if i >= len(times):
+                break
+            kept.append(i)
+            previous.append(timestamp)
+            timestamp = times[i]
             i += 1
-
-        waypoints = pd.concat(waypoints_list)
-        waypoints.index = range(len(waypoints))
-        return waypoints
+        kept = np.array(kept, dtype = int)
+        previous = np.array(previous, dtype = np.int64)
+
+        # Vectors between the positions before the kept positions and the kept positions,
+        # curvature of earth is neglected due to short distances
+        lat_start, lat_end = lat[kept - 1], lat[kept]
+        lon_start, lon_end = lon[kept - 1], lon[kept]
+        lon_start, lon_end = unwrap_crossovers(lon_start, lon_end)
+
+        # Create waypoints for every hour along the vectors
+        delta = times[kept] - previous
+        number_points = delta // hour
+        timestep = (delta / number_points).astype(np.int64)
+        step_lat = (lat_end - lat_start) / number_points
+        step_lon = (lon_end - lon_start) / number_points
+
+        counts = number_points - 1
+        segment = np.repeat(np.arange(len(kept)), counts)
+        j = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+
+        # Each kept position is preceded by its interpolated waypoints
+        positions = np.cumsum(number_points)
+        interpolated = positions[segment] - number_points[segment] + j
+        length = 1 + number_points.sum()
+
+        waypoint_times = np.empty(length, dtype = np.int64)
+        waypoint_lat = np.empty(length)
+        waypoint_lon = np.empty(length)
+
+        waypoint_times[0], waypoint_lat[0], waypoint_lon[0] = times[0], lat[0], lon[0]
+        waypoint_times[positions] = times[kept]
+        waypoint_lat[positions] = lat_end
+        waypoint_lon[positions] = lon[kept]
+
+        # Interpolated dates are truncated to full seconds
+        interpolated_times = previous[segment] + j * timestep[segment]
+        waypoint_times[interpolated] = interpolated_times - interpolated_times % 10**9
+        waypoint_lat[interpolated] = lat_start[segment] + j * step_lat[segment]
+        waypoint_lon[interpolated] = lon_start[segment] + j * step_lon[segment]
+
+        waypoint_dates = pd.DatetimeIndex(waypoint_times)
+        if dates.tz is not None:
+            waypoint_dates = waypoint_dates.tz_localize('UTC').tz_convert(dates.tz)
+
+        return pd.DataFrame({
+            'Date': waypoint_dates,
+            'Lat': waypoint_lat,
+            'Lon': normalize_longitudes(waypoint_lon)
+            })
 
     def to_dict(self):
         return {
@@ -305,6 +410,97 @@ class Stop:
 def stopDecoder(obj):
     return Stop(obj['duration'], obj['lat'], obj['lon'])
 
+class AdaptiveWaypoints:
+    """
+    Adaptive density of the waypoints, each waypoint starts one segment of the simulation.
+
+    Consecutive hourly segments are merged while ambient temperature, speed and heading
+    differ less than the thresholds from the first merged segment, up to maxduration.
+    Segments in which the temperature changes more than split are divided into shorter segments.
+    """
+    def __init__(self, temperature = 1.0, speed = 2.0, heading = 30.0, maxduration = timedelta(hours = 12), split = 3.0):
+        self.temperature = temperature
+        self.speed = speed
+        self.heading = heading
+        self.maxduration = maxduration
+        self.split = split
+
+    def apply(self, weatherdata):
+        """
+        Simplify weatherdata with hourly waypoints and their temperatures T.
+        Merged segments get the time-weighted mean temperature of their hours.
+
+        Returns:
+            weatherdata with the waypoints of the segments
+        """
+        if len(weatherdata) < 3:
+            return weatherdata
+
+        dates = weatherdata['Date']
+        seconds = geodesy.elapsed_seconds(dates)
+        lat = weatherdata['Lat'].to_numpy(dtype = float)
+        lon = weatherdata['Lon'].to_numpy(dtype = float)
+        T = weatherdata['T'].to_numpy(dtype = float)
+
+        durations = np.diff(seconds)
+        kinematics = geodesy.kinematics(dates, lat, lon)
+        speeds, headings = kinematics['speed'], kinematics['heading']
+
+        # Segments start at the first hour that differs too much from the start of the current segment
+        starts = [0]
+        for k in range(1, len(durations)):
+            start = starts[-1]
+            turn = abs((headings[k] - headings[start] + 180) % 360 - 180)
+            moving = speeds[k] > MIN_SPEED and speeds[start] > MIN_SPEED
+            if abs(T[k] - T[start]) > self.temperature or abs(speeds[k] - speeds[start]) > self.speed \
+                    or (moving and turn > self.heading) \
+                    or seconds[k + 1] - seconds[start] > self.maxduration.total_seconds():
+                starts.append(k)
+        starts = np.array(starts)
+
+        weighted = np.add.reduceat(T[:-1] * durations, starts)
+        total = np.add.reduceat(durations, starts)
+        mean = np.divide(weighted, total, out = T[starts].copy(), where = total > 0)
+
+        segments = weatherdata.iloc[np.append(starts, len(weatherdata) - 1)].copy()
+        segments.iloc[:-1, segments.columns.get_loc('T')] = mean
+
+        # Split single hours with fast temperature change, segments use the temperature at their start
+        splits = []
+        for start in starts[np.diff(np.append(starts, len(durations))) == 1]:
+            change = T[start + 1] - T[start]
+            pieces = int(np.ceil(abs(change) / self.split)) if self.split else 1
+            if pieces < 2:
+                continue
+            fractions = np.arange(1, pieces) / pieces
+            rows = weatherdata.iloc[[start] * (pieces - 1)].copy()
+            rows['Date'] = (dates.iloc[start] + pd.to_timedelta(fractions * durations[start], unit = 's')).round('s')
+            rows['Lat'] = lat[start] + fractions * (lat[start + 1] - lat[start])
+            rows['Lon'] = normalize_longitudes(lon[start] + fractions * ((lon[start + 1] - lon[start] + 180) % 360 - 180))
+            rows['T'] = T[start] + fractions * change
+            splits.append(rows)
+
+        segments = pd.concat([segments] + splits).sort_values('Date', kind = 'stable')
+        segments.index = range(len(segments))
+
+        print('Adaptive waypoints: {0} segments instead of {1}'.format(len(segments) - 1, len(weatherdata) - 1))
+        return segments
+
+    def to_dict(self):
+        return {
+            'temperature': self.temperature,
+            'speed': self.speed,
+            'heading': self.heading,
+            'maxduration': duration_to_string(self.maxduration),
+            'split': self.split
+        }
+
+def waypointsDecoder(obj):
+    return AdaptiveWaypoints(
+        temperature = obj.get('temperature', 1.0), speed = obj.get('speed', 2.0), heading = obj.get('heading', 30.0),
+        maxduration = obj.get('maxduration', timedelta(hours = 12)), split = obj.get('split', 3.0)
+        )
+
 def duration_to_string(duration):
     """Convert timedelta object to string in format H:M:S, e.g. 03:20:30"""
     days = duration.days
@@ -330,11 +526,7 @@ def timezone_to_string(timezone):
 
 def check_onsea(dataframe):
     """Check for all coordinates in dataframe, whether they are on the sea or not"""
-    coordinates = dataframe[['Lat', 'Lon']].values
-
-    result = [onsea(coordinates[i][0], coordinates[i][1]) for i in range(coordinates.shape[0])]
-
-    return result
+    return onsea(dataframe['Lat'].values, dataframe['Lon'].values).tolist()
 
 def check_crossover(longitude_start, longitude_end):
     """Check if -180 to +180 crossover appears between two coordinates"""
@@ -358,6 +550,15 @@ def direction_crossover(coordinates_start, coordinates_end):
 
     return np.array([direction_lat, direction_lon])
 
+def unwrap_crossovers(lon_start, lon_end):
+    """Array version of the -180 to +180 crossover handling of direction_crossover"""
+    lon_start = np.asarray(lon_start, dtype = float)
+    lon_end = np.asarray(lon_end, dtype = float)
+    crossover = (np.sign(lon_start) != np.sign(lon_end)) & (np.abs(lon_start) + np.abs(lon_end) > 180)
+    # Add 360 degrees to negative longitude to compensate for -180 + 180 crossover
+    negative = np.sign(lon_start) == -1
+    return np.where(crossover & negative, lon_start + 360, lon_start), np.where(crossover & ~negative, lon_end + 360, lon_end)
+
 def normalize_longitude(longitude):
     """Convert coordinates with absolute values over 180°:
 
@@ -371,14 +572,11 @@ def normalize_longitude(longitude):
     else:
         return longitude
 
+def normalize_longitudes(longitudes):
+    """Array version of normalize_longitude"""
+    longitudes = np.asarray(longitudes, dtype = float)
+    return np.where(np.abs(longitudes) > 180, longitudes - 360 * np.sign(longitudes), longitudes)
+
 def add_seconds(dataframe):
     """Add a column with total passed seconds to dataframe with ['Date'] column"""
-    start = dataframe['Date'].iloc[0]
-    length = len(dataframe.index)
-    seconds = np.zeros(length)
-
-    for i in range(length):
-        passed_timedelta = dataframe['Date'].iloc[i] - start
-        seconds[i] = passed_timedelta.total_seconds()
-
-    dataframe.insert(1, 'seconds', seconds, True) 
\ No newline at end of file
+    dataframe.insert(1, 'seconds', geodesy.elapsed_seconds(dataframe['Date']), True)
@@ -0,0 +1,81 @@
+import csv
+import os
+import re
+import subprocess
+import time
+
+# Name of the file in the logs folder, that collects the timings of all commands of a case
+TIMINGFILE = 'timings.csv'
+TIMINGCOLUMNS = ['start', 'command', 'returncode', 'wall', 'cpu_user', 'cpu_system', 'maxrss_mb', 'logfile']
+
+def openfoam_version():
+    """
+    Release of the sourced OpenFOAM environment from WM_PROJECT_VERSION, e.g. 2006 for v2006.
+    None if no environment is sourced or the release is not of openfoam.com, e.g. 8 of openfoam.org.
+    """
+    match = re.fullmatch(r'v(\d{4})', os.environ.get('WM_PROJECT_VERSION', ''))
+    if match is None:
+        return None
+    return int(match.group(1))
+
+def run(command, logfile, cwd = None, append = False, timingfile = None):
+    """
+    Run a command without shell and stream its output into logfile.
+
+    Wall time, CPU time and peak memory of the command and its waited-for children, e.g. the
+    processes of mpirun, are taken from the resource usage of the process and appended to timingfile.
+
+    Args:
+        command: list with the executable and its arguments
+        logfile: file for stdout and stderr of the command
+        append: append to logfile instead of overwriting it
+
+    Returns:
+        Dictionary with the timing of the command
+
+    Raises:
+        OSError: if the command exits with non-zero exit code
+    """
+    command = [str(argument) for argument in command]
+    start = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())
+    started = time.perf_counter()
+
+    with open(logfile, 'a' if append else 'w') as log:
+        process = subprocess.Popen(command, stdout = log, stderr = subprocess.STDOUT, cwd = cwd)
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        # Process is reaped by wait4, Popen must not wait for it again
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    timing = {
+        'start': start,
+        'command': subprocess.list2cmdline(command),
+        'returncode': process.returncode,
+        'wall': round(time.perf_counter() - started, 3),
+        'cpu_user': round(usage.ru_utime, 3),
+        'cpu_system': round(usage.ru_stime, 3),
+        # Linux reports the peak resident set size in kB
+        'maxrss_mb': round(usage.ru_maxrss / 1024, 1),
+        'logfile': os.path.basename(logfile)
+        }
+    if timingfile is not None:
+        save_timing(timing, timingfile)
+
+    if process.returncode != 0:
+        raise OSError('{0} failed with exit code {1}, see {2}'.format(
+            os.path.basename(command[0]), process.returncode, logfile
+            ))
+    return timing
+
+def save_timing(timing, timingfile):
+    """Append the timing of a command to a csv file, the header is written for new files"""
+    new = not os.path.exists(timingfile)
+    with open(timingfile, 'a', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = TIMINGCOLUMNS)
+        if new:
+            writer.writeheader()
+        writer.writerow(timing)
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+import ttm.convection as convection
+from ttm.route import unwrap_crossovers
+
+# Lower heattransfer coefficients make the simulation unphysical, the previous value is used instead
+MIN_HEATTRANSFERCOEFFICIENT = 0.2
+# Longest solver run of the continuous mode in s, heattransfer coefficient and solar radiation are
+# updated at each restart
+CHUNK_DURATION = 24 * 3600
+# Relative change of the forced convection heattransfer coefficient that starts a new solver run
+H_TOLERANCE = 0.1
+
+def chunks(segments, maxduration = CHUNK_DURATION, tolerance = H_TOLERANCE):
+    """
+    Group consecutive segments into solver runs of the continuous mode.
+
+    A run ends after maxduration, when the convection changes between natural and forced or when the
+    forced heattransfer coefficient differs by more than tolerance from the first segment of the run.
+
+    Returns:
+        List of (start, stop) positions of the segments in each run, stop is exclusive
+    """
+    seconds = segments['seconds'].values
+    durations = segments['duration'].values
+    h = segments['h'].values
+
+    runs = []
+    start = 0
+    for i in range(1, len(segments)):
+        natural = np.isnan(h[start])
+        if (
+            seconds[i] - seconds[start] >= maxduration
+            or natural != np.isnan(h[i])
+            or (not natural and abs(h[i] - h[start]) > tolerance * h[start])
+            ):
+            runs.append((start, i))
+            start = i
+    if len(segments) > 0:
+        runs.append((start, len(segments)))
+    return runs
+
+def mean_heattransfer_coefficient(segments):
+    """Heattransfer coefficient of forced convection averaged over the duration of the segments"""
+    return np.average(segments['h'].values, weights = segments['duration'].values)
+
+def table(times, values):
+    """Function1 table for OpenFOAM, values are interpolated linearly between the times"""
+    rows = ' '.join('({0:.10g} {1:.10g})'.format(time, value) for time, value in zip(times, values))
+    return 'table ( {} )'.format(rows)
+
+def boundary_field(borderregion, h, Ta):
+    """
+    Entries of the externalWallHeatFluxTemperature patches for changeDictionaryDict.
+
+    Args:
+        h: heattransfer coefficient, uniform scalar
+        Ta: ambient temperature in Kelvin, scalar or Function1 table
+    """
+    if borderregion == 'airInside':
+        return {'carrier': {'h': h, 'Ta': Ta}, 'bottom': {'Ta': Ta}}
+    if borderregion == 'battery0_0':
+        return {'battery0_0_to_airInside': {'h': h, 'Ta': Ta}}
+    raise ValueError('Only support for borderregions airInside for carrier transport or battery0_0 for car transport')
+
+def grid_east(direction_lat, direction_lon):
+    """
+    Vectors for east in the grid coordinates of the carrier for arrays of travel directions,
+    the x-axis of the grid points in travel direction. NaN for waypoints without movement.
+    """
+    x_axis = np.column_stack([direction_lon, direction_lat])
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        x_axis = x_axis / np.linalg.norm(x_axis, axis = 1, keepdims = True)
+    east = np.array([1, 1]) / np.sqrt(2)
+    angle = np.arccos(np.clip(x_axis @ east, -1.0, 1.0))
+    return np.column_stack([
+        np.cos(angle) * east[0] + np.sin(angle) * east[1],
+        -np.sin(angle) * east[0] + np.cos(angle) * east[1],
+        np.zeros(len(angle))
+        ])
+
+def segments(
+    weatherdata, offsets, length_forced, speed_threshold, solarintensity, extinctioncoefficient, onsea = False
+    ):
+    """
+    Schedule of the solver runs, one row for the segment starting at each waypoint except the last.
+
+    Heattransfer coefficients of natural convection depend on the wall temperature at the start of
+    the segment and are NaN, they are calculated during the simulation.
+
+    Args:
+        weatherdata: weatherdata with Date, seconds, Lat, Lon, T and speed columns
+        offsets: offsets to UTC in hours at each waypoint
+        solarintensity, extinctioncoefficient: solar parameters by month as in radiationProperties
+
+    Returns:
+        DataFrame with solver, boundary and radiation parameters of each segment
+    """
+    dates = pd.DatetimeIndex(weatherdata['Date'])
+    seconds = weatherdata['seconds'].values
+    lat = weatherdata['Lat'].values
+    lon = weatherdata['Lon'].values
+    speeds = weatherdata['speed'].values[:-1].copy()
+    if onsea:
+        speeds[weatherdata['onsea'].values[:-1] == True] = 0
+
+    durations = np.diff(seconds)
+    writeintervals = np.floor(durations)
+    # Limit timesteps to fixed value for small writeintervals, or timesteps can be bigger than writeInterval
+    adjust = np.where(writeintervals < 1000, 'no', 'yes')
+
+    with np.errstate(invalid = 'ignore'):
+        h = np.where(speeds < speed_threshold, np.nan, convection.coeff_forced(length_forced, speeds))
+    h[h < MIN_HEATTRANSFERCOEFFICIENT] = np.nan
+
+    # Solar time of the simulation start at the local time of the current waypoint
+    offsets = np.asarray(offsets, dtype = float)[:-1]
+    startdates = dates[0] + pd.to_timedelta(np.nan_to_num(offsets), unit = 'h')
+    starttimes = startdates.hour + startdates.minute / 60 + startdates.second / 3600
+
+    lon_start, lon_end = unwrap_crossovers(lon[:-1], lon[1:])
+    east = grid_east(lat[1:] - lat[:-1], lon_end - lon_start)
+    months = dates[:-1].month.astype(str)
+
+    return pd.DataFrame({
+        'Date': dates[:-1],
+        'seconds': seconds[:-1],
+        'duration': durations,
+        'writeInterval': writeintervals,
+        'adjustTimeStep': adjust,
+        'Lat': lat[:-1],
+        'Lon': lon[:-1],
+        'Ta': weatherdata['T'].values[:-1] + 273.15,
+        'speed': speeds,
+        'h': h,
+        'localStandardMeridian': offsets,
+        'startDay': np.where(np.isnan(offsets), np.nan, startdates.dayofyear),
+        'startTime': np.where(np.isnan(offsets), np.nan, starttimes),
+        'A': [solarintensity[month] for month in months],
+        'B': [extinctioncoefficient[month] for month in months],
+        'gridEast_x': east[:, 0],
+        'gridEast_y': east[:, 1],
+        'gridEast_z': east[:, 2]
+        })
@@ -0,0 +1,102 @@
+from datetime import timedelta
+import json
+import os
+
+import pandas as pd
+
+from ttm import geodesy
+import ttm.weather as weather
+from ttm.transport import TransportDecoder, _route_and_weather, complete_weatherdata
+
+class Sweep:
+    """
+    Transports on the same route with different start dates.
+
+    The waypoints of the route are created once and shifted to each start date. The weather
+    of all transports is resolved in one batched pass, so stations, source files and memoized
+    waypoints of overlapping days are shared between the transports.
+    """
+    def __init__(self, route, starts, weatherprovider = None, adaptive_waypoints = None):
+        if len(starts) == 0:
+            raise ValueError('A sweep needs at least one start date')
+        self.route = route
+        self.starts = sorted(starts)
+        self.weatherprovider = weatherprovider
+        self.adaptive_waypoints = adaptive_waypoints
+
+    def timelines(self):
+        """Hourly waypoints of the route for each start date"""
+        waypoints = self.route.waypoints(self.starts[0])
+        offsets = pd.to_timedelta(geodesy.elapsed_seconds(waypoints['Date']), unit = 's')
+
+        timelines = []
+        for start in self.starts:
+            timeline = waypoints.copy()
+            timeline['Date'] = pd.Timestamp(start) + offsets
+            timelines.append(timeline)
+        return timelines
+
+    def weatherdata(self):
+        """Weatherdata for each start date, in the format of the weatherdata of a transport"""
+        timelines = self.timelines()
+        stacked = pd.concat(timelines, ignore_index = True)
+        print('Gathering weatherdata for {0} transports with {1} waypoints'.format(len(timelines), len(stacked)))
+
+        temperatures, distances = weather.waypoints_temperature(
+            stacked.Date.tolist(), stacked.Lat.values, stacked.Lon.values, provider = self.weatherprovider
+            )
+
+        result = []
+        offset = 0
+        for timeline in timelines:
+            rows = slice(offset, offset + len(timeline))
+            offset += len(timeline)
+            timeline['T'], timeline['distance'] = temperatures[rows], distances[rows]
+            result.append(complete_weatherdata(timeline, self.adaptive_waypoints))
+        return result
+
+    def save(self, directory):
+        """
+        Save the weatherdata of each start date as csv, the files can replace the weatherdata
+        of a transport. A summary of all transports is saved in sweep.csv.
+        """
+        os.makedirs(directory, exist_ok = True)
+
+        summary = []
+        for start, weatherdata in zip(self.starts, self.weatherdata()):
+            filename = 'weatherdata_{}.csv'.format(start.strftime('%Y-%m-%d_%H-%M'))
+            weatherdata.to_csv(os.path.join(directory, filename), encoding='utf-8', index=False)
+            summary.append({
+                'start': start,
+                'end': weatherdata['Date'].iloc[-1],
+                'waypoints': len(weatherdata),
+                'T_min': weatherdata['T'].min(),
+                'T_mean': round(weatherdata['T'].mean(), 2),
+                'T_max': weatherdata['T'].max(),
+                'filename': filename
+            })
+
+        summary = pd.DataFrame(summary)
+        summary.to_csv(os.path.join(directory, 'sweep.csv'), encoding='utf-8', index=False)
+        return summary
+
+def start_dates(first, last, step = timedelta(days = 7)):
+    """Start dates from first to last in steps, e.g. weekly departures of a year"""
+    if step <= timedelta(0):
+        raise ValueError('Step between start dates has to be positive')
+    starts = []
+    start = first
+    while start <= last:
+        starts.append(start)
+        start = start + step
+    return starts
+
+def from_json(filepath, starts):
+    """Create a sweep over start dates for the route, weather and waypoints of a transport json file"""
+    with open(filepath) as json_file:
+        json_dict = json.load(json_file, cls=TransportDecoder)
+    path = os.path.dirname(filepath)
+
+    route, weatherprovider, adaptive_waypoints = _route_and_weather(json_dict, path)
+
+    return Sweep(route, starts, weatherprovider = weatherprovider, adaptive_waypoints = adaptive_waypoints)
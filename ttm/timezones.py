@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import timezonefinder
+
+# Size of the cells in degrees, waypoints in the same cell share their timezone
+CELLSIZE = 0.01
+
+# Timezone finder shared by all lookups, loading its polygons is expensive
+_finder = None
+# Timezone names by cell, None for cells without timezone, e.g. on sea
+_names = {}
+# Offsets to UTC in hours by timezone name and hour since epoch
+_offsets = {}
+
+def finder():
+    """Timezone finder, created on first use"""
+    global _finder
+    if _finder is None:
+        _finder = timezonefinder.TimezoneFinder()
+    return _finder
+
+def timezone_names(lat, lon):
+    """Timezone names for arrays of coordinates, None where no timezone is found"""
+    cells = np.column_stack([
+        np.floor(np.asarray(lat, dtype = float) / CELLSIZE), np.floor(np.asarray(lon, dtype = float) / CELLSIZE)
+        ]).astype(np.int64)
+    unique, inverse = np.unique(cells, axis = 0, return_inverse = True)
+
+    names = []
+    for index_lat, index_lon in unique:
+        key = (int(index_lat), int(index_lon))
+        if key not in _names:
+            # Centre of the cell
+            _names[key] = finder().certain_timezone_at(
+                lat = (index_lat + 0.5) * CELLSIZE, lng = (index_lon + 0.5) * CELLSIZE
+                )
+        names.append(_names[key])
+    return np.array(names, dtype = object)[inverse.ravel()]
+
+def _offset(name: str, hour: int):
+    if (name, hour) not in _offsets:
+        # Offset at the UTC instant, naive local times are ambiguous or missing at daylight saving switches
+        utc = datetime.fromtimestamp(hour * 3600, tz = timezone.utc)
+        _offsets[(name, hour)] = utc.astimezone(ZoneInfo(name)).utcoffset().total_seconds() / 3600
+    return _offsets[(name, hour)]
+
+def utcoffsets(datetimes, lat, lon):
+    """
+    Offsets to UTC in hours for arrays of datetimes and coordinates. Locations without timezone,
+    e.g. on sea, are approximated with one hour per 15 degrees longitude.
+    """
+    lon = np.asarray(lon, dtype = float)
+    hours = pd.DatetimeIndex(datetimes).values.astype('datetime64[h]').astype(np.int64)
+    names = timezone_names(lat, lon)
+
+    offsets = np.floor(lon / 15)
+    for i in np.flatnonzero(names != None):
+        offsets[i] = _offset(names[i], int(hours[i]))
+    return offsets
+
+def clear():
+    """Clear the memoized timezones and offsets"""
+    _names.clear()
+    _offsets.clear()
@@ -13,15 +13,17 @@ import numpy as np
 import pandas as pd
 
 from ttm.cargo import cargoDecoder
+from ttm import geodesy
+import ttm.pipeline as pipeline
 import ttm.weather as weather
-from ttm.route import routeDecoder, stopDecoder, add_seconds
+from ttm.route import routeDecoder, stopDecoder, waypointsDecoder, add_seconds
 
 # matplotlib.use('Agg')
 
 class Transport:
     def __init__(
         self, path, transporttype, start, initial_temperature, 
-        arrival_temperature, cargo, route
+        arrival_temperature, cargo, route, weatherprovider = None, adaptive_waypoints = None
         ):
         self.path = path
         self.type = transporttype
@@ -30,6 +32,10 @@ class Transport:
         self.arrival_temperature = arrival_temperature
         self.cargo = cargo
         self.route = route
+        # Source of weatherdata, NOAA databases if not set
+        self.weatherprovider = weatherprovider
+        # Merge and split the hourly waypoints, hourly waypoints if not set
+        self.adaptive_waypoints = adaptive_waypoints
 
         self._jsonpath = os.path.join(self.path, 'transport.json')
         self._weatherdatapath = os.path.join(self.path, 'weatherdata.csv')
@@ -93,10 +99,33 @@ class Transport:
         lat = weatherdata.Lat.values
         lon = weatherdata.Lon.values
         # Read temperature from NOAA server and interpolate missing values
-        weatherdata['T'], weatherdata['distance'] = weather.waypoints_temperature(datetimes, lat, lon)
-        weatherdata['T'] = weatherdata['T'].interpolate()
+        weatherdata['T'], weatherdata['distance'] = weather.waypoints_temperature(
+            datetimes, lat, lon, provider = self.weatherprovider
+            )
         
-        add_seconds(weatherdata)
+        return self._save_weatherdata(weatherdata)
+
+    async def get_weatherdata_async(self, progress = None):
+        """
+        Awaitable version of get_weatherdata, downloads run concurrently in an asyncio pipeline.
+        progress is called with a dict for each progress event of the pipeline.
+        """
+        print('Gathering weatherdata for all waypoints')
+        weatherdata = self.route.waypoints(self.start)
+
+        datetimes = weatherdata.Date.tolist()
+        lat = weatherdata.Lat.values
+        lon = weatherdata.Lon.values
+        weatherdata['T'], weatherdata['distance'] = await pipeline.waypoints_temperature(
+            datetimes, lat, lon, provider = self.weatherprovider, progress = progress
+            )
+
+        self.weatherdata = self._save_weatherdata(weatherdata)
+        return self.weatherdata
+
+    def _save_weatherdata(self, weatherdata):
+        """Complete and save weatherdata as csv"""
+        weatherdata = complete_weatherdata(weatherdata, self.adaptive_waypoints)
         weatherdata.to_csv(self._weatherdatapath, encoding='utf-8', index=False)
 
         return weatherdata
@@ -137,7 +166,7 @@ class TransportEncoder(JSONEncoder):
                     stops.append(stop)
 
             # Return dictionary for json file
-            return {
+            transport_dict = {
                 "type": transport.type,
                 "start": transport.start.strftime("%s %s" % (
                     self.DATE_FORMAT, self.TIME_FORMAT
@@ -148,6 +177,11 @@ class TransportEncoder(JSONEncoder):
                 "stops": stops,
                 "cargo": [item.to_dict() for item in transport.cargo]           
             }
+            if transport.weatherprovider is not None:
+                transport_dict["weather"] = transport.weatherprovider.to_dict()
+            if transport.adaptive_waypoints is not None:
+                transport_dict["adaptive_waypoints"] = transport.adaptive_waypoints.to_dict()
+            return transport_dict
 
 class TransportDecoder(JSONDecoder):
     """
@@ -181,6 +215,17 @@ class TransportDecoder(JSONDecoder):
         else:
             return (s, end)
 
+def complete_weatherdata(weatherdata, adaptive_waypoints = None):
+    """Interpolate missing temperatures, adapt the waypoints and add seconds and segment kinematics"""
+    weatherdata['T'] = weatherdata['T'].interpolate()
+    if adaptive_waypoints is not None:
+        weatherdata = adaptive_waypoints.apply(weatherdata)
+
+    add_seconds(weatherdata)
+    geodesy.add_kinematics(weatherdata)
+
+    return weatherdata
+
 def parse_duration(duration_str):
     """
     Method to parse a duration in format hours:minutes:seconds as datetime.timedelta instance
@@ -207,6 +252,26 @@ def parse_timezone(timezone_str):
     else:
          return timedelta(hours = -hours, minutes = -minutes)
 
+def _route_and_weather(json_dict, path):
+    """Decode route with stops, weather provider and adaptive waypoints of a transport json dict"""
+    # Create stop instances
+    if 'stops' in json_dict:
+        stops = [stopDecoder(stop) for stop in json_dict['stops']]
+    else:
+        stops = []
+    # Create route
+    route = routeDecoder(json_dict['route'], path, stops = stops)
+    # Create weather provider, default are NOAA databases
+    if 'weather' in json_dict:
+        weatherprovider = weather.providerDecoder(json_dict['weather'], path)
+    else:
+        weatherprovider = None
+    if 'adaptive_waypoints' in json_dict:
+        adaptive_waypoints = waypointsDecoder(json_dict['adaptive_waypoints'])
+    else:
+        adaptive_waypoints = None
+    return route, weatherprovider, adaptive_waypoints
+
 def from_json(filepath):
     """Create Transport instance from json file"""   
     with open(filepath) as json_file:
@@ -219,17 +284,11 @@ def from_json(filepath):
     arrival_temperature = json_dict['arrival_temperature']
     # Create cargo instances
     cargo = [cargoDecoder(item) for item in json_dict['cargo']] 
-    # Create stop instances
-    if 'stops' in json_dict:
-        stops = [stopDecoder(stop) for stop in json_dict['stops']]
-    else:
-        stops = []
-    # Create route
-    route = routeDecoder(json_dict['route'], path, stops = stops)
+    route, weatherprovider, adaptive_waypoints = _route_and_weather(json_dict, path)
     
     # Return the transport instance
     return Transport(
         path, transporttype, start, 
         initial_temperature, arrival_temperature, 
-        cargo, route
+        cargo, route, weatherprovider = weatherprovider, adaptive_waypoints = adaptive_waypoints
         )
\ No newline at end of file
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
+from datetime import timedelta
 import glob
+import json
 import os
 import shutil
+import sys
 
+from dateutil.parser import parse
+
+import ttm.cache as cache
+import ttm.sweep as sweep
 import ttm.transport as tp
 from ttm.case import Case
 import ttm.visualization as visualization
@@ -71,13 +78,111 @@ parser.add_argument(
     help="Reload weatherdata", 
     action="store_true"
     )
+parser.add_argument(
+    "--continuous", 
+    help="Restart the solver at most once per day with time tables for the ambient temperature, needs OpenFOAM v2006 or newer", 
+    action="store_true"
+    )
 parser.add_argument(
     "--savetimes", "-s", 
     help="Save timedirectories", 
     action="store_true"
     )
 
+# Subcommand for the weather cache, e.g. ttm cache stats
+cache_parser = argparse.ArgumentParser(prog='ttm cache', description='Manage the cache of weather source files')
+cache_parser.add_argument(
+    "command", 
+    help="Print statistics, remove expired and least recently used entries or delete the cache", 
+    choices=["stats", "prune", "clear"]
+    )
+cache_parser.add_argument(
+    "--maxsize", 
+    type=float, 
+    help="Size limit in GB for prune, default from TTM_CACHE_SIZE", 
+    metavar="GB"
+    )
+
+def cache_command(argv):
+    args = cache_parser.parse_args(argv)
+
+    if args.command == 'stats':
+        cache.report()
+    elif args.command == 'prune':
+        max_size = None if args.maxsize is None else int(args.maxsize * 1e9)
+        removed, freed = cache.prune(max_size)
+        print('Removed {0} entries, freed {1:.1f} MB'.format(removed, freed / 1e6))
+    elif args.command == 'clear':
+        cache.clear()
+        print('Deleted cache {}'.format(cache.CACHE_DIR))
+
+# Subcommand for start date sweeps, e.g. ttm sweep --first 2021-01-04 --last 2021-12-27
+sweep_parser = argparse.ArgumentParser(
+    prog='ttm sweep', description='Gather weatherdata of a transport for many start dates'
+    )
+sweep_parser.add_argument(
+    "--transport", "-t", 
+    help="Alternative transport directory (instead of cwd)", 
+    metavar="<dir>", 
+    default=os.getcwd()
+    )
+sweep_parser.add_argument(
+    "--dates", 
+    type=parse, 
+    help="Start dates of the transports", 
+    nargs="+", 
+    metavar="date"
+    )
+sweep_parser.add_argument(
+    "--first", 
+    type=parse, 
+    help="First start date of a range, default start of the transport", 
+    metavar="date"
+    )
+sweep_parser.add_argument(
+    "--last", 
+    type=parse, 
+    help="Last start date of a range", 
+    metavar="date"
+    )
+sweep_parser.add_argument(
+    "--step", 
+    type=float, 
+    help="Days between the start dates of a range", 
+    metavar="days", 
+    default=7
+    )
+sweep_parser.add_argument(
+    "--output", "-o", 
+    help="Directory of the weatherdata files, default sweep in the transport directory", 
+    metavar="<dir>"
+    )
+
+def sweep_command(argv):
+    args = sweep_parser.parse_args(argv)
+    jsonpath = os.path.join(args.transport, 'transport.json')
+
+    if args.dates:
+        starts = args.dates
+    elif args.last:
+        first = args.first
+        if first is None:
+            with open(jsonpath) as json_file:
+                first = json.load(json_file, cls=tp.TransportDecoder)['start']
+        starts = sweep.start_dates(first, args.last, timedelta(days = args.step))
+    else:
+        sweep_parser.error('Start dates are needed, use --dates or a range with --last')
+
+    transport_sweep = sweep.from_json(jsonpath, starts)
+    summary = transport_sweep.save(args.output or os.path.join(args.transport, 'sweep'))
+    print(summary.to_string(index = False))
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'cache':
+        return cache_command(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'sweep':
+        return sweep_command(sys.argv[2:])
+
     args = parser.parse_args()
 
     # Get the path of the transport directory, default cwd
@@ -127,9 +232,13 @@ def main():
     # Execute the OpenFOAM solver
     if transport.type == 'car':
         transportcase.switch_to_car()
-        transportcase.run(borderregion = 'battery0_0')
+        borderregion = 'battery0_0'
+    else:
+        borderregion = 'airInside'
+    if args.continuous:
+        transportcase.run_continuous(borderregion = borderregion)
     else:
-        transportcase.run()
+        transportcase.run(borderregion = borderregion)
 
     # Simulate arrival
     if args.arrival:
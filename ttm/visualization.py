@@ -6,7 +6,6 @@ import json
 
 import altair as alt
 import branca
-import geopy.distance
 import folium
 from folium import plugins
 import matplotlib
@@ -16,6 +15,8 @@ import numpy as np
 import pandas as pd
 import tikzplotlib
 
+from ttm import geodesy
+
 matplotlib.use('Agg')
 
 TUMBLUE = '#0065BD'
@@ -60,14 +61,16 @@ def filter_stops(waypoints):
     """Method to filter stop locations from all waypoints"""
     DISTANCETHRESHOLD = 15
     coordinates = waypoints[['Lat', 'Lon']].values
+    distances = geodesy.vincenty(
+        coordinates[:-1, 0], coordinates[:-1, 1], coordinates[1:, 0], coordinates[1:, 1]
+        ) / 1000
     stop_list = []
     stops = pd.DataFrame(columns=[
         'start', 'end', 'Lat', 'Lon', 'timestamps', 'ambient', 'average_air'
         ])
 
     for i in range(len(waypoints) - 1):
-        distance = geopy.distance.distance(coordinates[i, :],coordinates[i + 1, :]).km
-        if distance <= DISTANCETHRESHOLD: 
+        if distances[i] <= DISTANCETHRESHOLD: 
             # First point of stop needs to be added
             if stop_list == []:
                 stop_list.append(waypoints.loc[i, :])
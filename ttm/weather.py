@@ -1,117 +1,370 @@
 import calendar
-import copy
+from collections import OrderedDict
 from datetime import date, datetime, timedelta 
-import ftplib
+import gzip
+import hashlib
 import os
-import shutil
-import time
+import threading
+from urllib.request import urlopen
 import warnings
 
 from bs4 import BeautifulSoup
-import geopy.distance
 import netCDF4 as nc
 import numpy as np
 import pandas as pd 
-import requests
 from scipy import spatial
 
-WEATHERDATAPATH = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), 'weatherdata'
-    )
+from ttm import cache
+from ttm.download import Downloader
+from ttm.memo import WaypointMemo, keys as memo_keys
 
-if not os.path.exists(WEATHERDATAPATH):
-            os.makedirs(WEATHERDATAPATH)
+# Servers of weather source files, can be replaced by local stand-in servers
+NCEI_URL = os.environ.get('TTM_NCEI_URL', 'https://www.ncei.noaa.gov/')
+NOAA_FTP_URL = os.environ.get('TTM_NOAA_FTP_URL', 'ftp://ftp.ncei.noaa.gov/pub/data/noaa/')
+# Number of concurrent downloads
+DOWNLOAD_WORKERS = 4
 
 #NOAA database saves temperature readings with scaling factor
 T_SCALINGFACTOR = 0.1
+# Number of parsed ISD Lite station-year files kept in memory
+STATIONYEAR_CACHESIZE = 64
+# Maximum distance to a weather station in km
+MAX_STATION_DISTANCE = 300
+# Maximum time between two readings of a station in hours, that is filled by interpolation
+MAX_GAP_HOURS = 3
+# Interpolation between stations: power of inverse distance weighting, 
+# range in km and nugget of the exponential covariance for kriging
+IDW_POWER = 2
+KRIGING_RANGE = 150
+KRIGING_NUGGET = 0.05
+# Uniform grid of OISST files in degrees and number of cells in latitude and longitude
+OISST_GRIDSIZE = 0.25
+OISST_SHAPE = (720, 1440)
+# Number of daily OISST files kept open
+OISST_CACHESIZE = 32
+# Mean earth radius in km
+EARTH_RADIUS = 6371.0088
+
+# Parsed ISD Lite station-year files, least recently used first
+_station_years = OrderedDict()
+# Station-year files are also parsed by the threads of the asynchronous pipeline
+_station_years_lock = threading.Lock()
+# The netCDF library is not thread-safe, files are only read by one thread at a time
+_netcdf_lock = threading.RLock()
+# Opened daily OISST files, least recently used first
+_oisst_files = OrderedDict()
+# Daily OISST files are also opened by the threads of the asynchronous pipeline
+_oisst_files_lock = threading.Lock()
+# Shared downloader with pooled sessions, created on first use
+_downloader = None
+# Land/sea mask on the OISST grid, loaded on first use
+_landsea_mask = None
+
+def get_downloader():
+    """Get the shared downloader for all weather source files"""
+    global _downloader
+    if _downloader is None:
+        _downloader = Downloader(workers = DOWNLOAD_WORKERS)
+    return _downloader
 
 def hour_rounder(t):
     """ Rounds to nearest hour by adding a timedelta hour if minute >= 30 """
     return (t.replace(second=0, microsecond=0, minute=0, hour=t.hour)
                +timedelta(hours=t.minute//30))
 
+def epoch_hours(datetimes):
+    """Convert datetimes to full hours since epoch"""
+    return pd.DatetimeIndex(datetimes).values.astype('datetime64[h]').astype(np.int64)
+
+def epoch_seconds(datetimes):
+    """Convert datetimes to seconds since epoch"""
+    return pd.DatetimeIndex(datetimes).values.astype('datetime64[s]').astype(np.int64)
+
+def group_by_day(datetimes):
+    """Group positions of datetimes by their date"""
+    groups = {}
+    for i, input_date in enumerate(datetimes):
+        groups.setdefault(input_date.date(), []).append(i)
+    return {day: np.array(rows) for day, rows in groups.items()}
+
+def unit_vectors(lat, lon):
+    """Cartesian coordinates on the unit sphere for latitudes and longitudes in degrees"""
+    lat = np.radians(np.atleast_1d(lat))
+    lon = np.radians(np.atleast_1d(lon))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def chord_to_km(chord):
+    """Convert chord length on the unit sphere to great circle distance in km"""
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+class StationIndex:
+    """
+    Prebuilt index of ISD stations for nearest station queries.
+
+    Station coordinates, periods of record and the monthly inventory are converted 
+    once from isd-history.csv and isd-inventory.csv into numpy files and loaded 
+    with memory mapping. Nearest stations are found with a k-nearest query on a 
+    KD-tree of all stations, stations without data are masked instead of removed.
+    """
+    STATIONS_DTYPE = [
+        ('USAF', 'U6'), ('WBAN', 'U5'), ('LAT', 'f8'), ('LON', 'f8'), ('BEGIN', 'i4'), ('END', 'i4')
+        ]
+    INVENTORY_DTYPE = [('station', 'i4'), ('YEAR', 'i2'), ('counts', 'i4', 12)]
+    # Initial number of neighbours for the k-nearest query
+    K = 8
+
+    def __init__(self, stations_path: str, inventory_path: str):
+        self.stations = np.load(stations_path, mmap_mode='r')
+        self.inventory = np.load(inventory_path, mmap_mode='r')
+        # KD-tree on unit vectors, so euclidean distances are chords on the sphere
+        self.tree = spatial.cKDTree(unit_vectors(self.stations['LAT'], self.stations['LON']))
+        self._masks = {}
+
+    @classmethod
+    def load(cls, isd_history_path: str, isd_inventory_path: str):
+        """Load index next to the csv files, rebuild it if the csv files are newer"""
+        directory = os.path.dirname(isd_history_path)
+        stations_path = os.path.join(directory, 'isd-stations.npy')
+        inventory_path = os.path.join(directory, 'isd-inventory.npy')
+
+        sources_mtime = max(os.path.getmtime(isd_history_path), os.path.getmtime(isd_inventory_path))
+        if any(
+            not os.path.exists(path) or os.path.getmtime(path) < sources_mtime 
+            for path in [stations_path, inventory_path]
+            ):
+            cls.build(isd_history_path, isd_inventory_path, stations_path, inventory_path)
+
+        return cls(stations_path, inventory_path)
+
+    @classmethod
+    def build(cls, isd_history_path, isd_inventory_path, stations_path, inventory_path):
+        """Convert isd history and inventory csv files to numpy files"""
+        print('Building ISD station index')
+        history = pd.read_csv(isd_history_path, dtype={'USAF': str, 'WBAN': str})
+        # Remove stations that do not have a location
+        history = history[history.LAT.notnull() & history.LON.notnull()]
+        history = history.drop_duplicates(subset=['USAF', 'WBAN'])
+        history.index = range(len(history))
+
+        stations = np.empty(len(history), dtype=cls.STATIONS_DTYPE)
+        for name in stations.dtype.names:
+            stations[name] = history[name].values
+
+        inventory = pd.read_csv(isd_inventory_path, dtype={'USAF': str, 'WBAN': str})
+        history['station'] = history.index
+        inventory = inventory.merge(history[['USAF', 'WBAN', 'station']], on=['USAF', 'WBAN'])
+        inventory = inventory.sort_values(['station', 'YEAR'])
+
+        inventory_array = np.empty(len(inventory), dtype=cls.INVENTORY_DTYPE)
+        inventory_array['station'] = inventory['station'].values
+        inventory_array['YEAR'] = inventory['YEAR'].values
+        months = [str.upper(calendar.month_abbr[i]) for i in range(1, 13)]
+        inventory_array['counts'] = inventory[months].values
+
+        np.save(stations_path, stations)
+        np.save(inventory_path, inventory_array)
+
+    def available(self, input_date):
+        """Mask of stations with records at input_date and hourly data for the whole month"""
+        date_int = int(input_date.strftime('%Y%m%d'))
+        if date_int not in self._masks:
+            # Remove all stations which have no records at the desired date
+            mask = (self.stations['BEGIN'] < date_int) & (self.stations['END'] > date_int)
+
+            # Check if the dataset of the station has hourly data for that month
+            inventory = self.inventory[self.inventory['YEAR'] == input_date.year]
+            days_in_month = calendar.monthrange(input_date.year, input_date.month)[1]
+            complete = inventory['counts'][:, input_date.month - 1] / days_in_month >= 24
+            coverage = np.zeros(len(self.stations), dtype=bool)
+            coverage[inventory['station'][complete]] = True
+
+            self._masks[date_int] = mask & coverage
+
+        return self._masks[date_int]
+
+    def nearest(self, input_date, lat: float, lon: float, exclude = ()):
+        """
+        Find the nearest station with full hourly coverage in the month of input_date.
+
+        Returns:
+            index: position of the station in the index
+            distance: great circle distance to the station in km
+        """
+        mask = self.available(input_date).copy()
+        mask[list(exclude)] = False
+        number_available = np.count_nonzero(mask)
+
+        if number_available == 0:
+            raise ValueError('No station available for query datetime')
+
+        query = unit_vectors(lat, lon)[0]
+        k = min(self.K, len(self.stations))
+        while True:
+            chords, indices = self.tree.query(query, k=k)
+            chords, indices = np.atleast_1d(chords), np.atleast_1d(indices)
+            valid = mask[indices]
+            if valid.any():
+                first = np.argmax(valid)
+                return indices[first], chord_to_km(chords[first])
+            # Widen the query until an available station is among the neighbours
+            k = min(k * 4, len(self.stations))
+
+    def query(self, input_date, lats, lons, k: int, max_distance: float):
+        """
+        Candidate stations for several locations at input_date, sorted by distance.
+
+        Returns:
+            indices: positions of candidate stations per location, -1 if no candidate
+            distances: great circle distances to the candidates in km
+            complete: whether all available stations within max_distance are candidates
+        """
+        mask = self.available(input_date)
+        k = min(k, len(self.stations))
+
+        chords, indices = self.tree.query(unit_vectors(lats, lons), k=k)
+        distances = chord_to_km(chords).reshape(-1, k)
+        indices = indices.reshape(-1, k)
+        complete = (k == len(self.stations)) | (distances[:, -1] > max_distance)
+
+        # Move valid candidates to the front and keep them sorted by distance
+        valid = mask[indices] & (distances <= max_distance)
+        order = np.argsort(~valid, axis=1, kind='stable')
+        indices = np.take_along_axis(indices, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        valid = np.take_along_axis(valid, order, axis=1)
+        indices[~valid] = -1
+        distances[~valid] = np.inf
+
+        return indices, distances, complete
+
+    def filename(self, index, year: int):
+        """Name of the ISD Lite file of the station at the position in the index, e.g. 010020-99999-2019.gz"""
+        return '{0}-{1}-{2}.gz'.format(self.stations['USAF'][index], self.stations['WBAN'][index], year)
+
+    def station(self, index):
+        """Get the station at the position in the index as one row dataframe"""
+        return pd.DataFrame(self.stations[[index]], index=[index])
+
+class StationYear:
+    """
+    Hourly temperatures of one ISD Lite station-year file as typed arrays.
+    Timestamps are saved as hours since epoch, temperatures with the scaling factor of the database.
+    """
+    DTYPE = [('hour', 'i8'), ('T', 'i2')]
+    MISSING = -9999
+
+    def __init__(self, data):
+        self.data = data
+        self._valid = None
+
+    @classmethod
+    def read(cls, filepath: str):
+        """Parse gzipped ISD Lite file, see isd-lite-format.pdf in doc"""
+        col_names = ['Year', 'Month', 'Day', 'Hour', 'T']
+        df = pd.read_csv(
+            filepath, compression='gzip', sep=r'\s+', header=None, 
+            usecols=[0,1,2,3,4], names=col_names
+            )
+
+        data = np.empty(len(df), dtype=cls.DTYPE)
+        dates = pd.to_datetime(df[['Year', 'Month', 'Day', 'Hour']].rename(columns=str.lower))
+        data['hour'] = dates.values.astype('datetime64[h]').astype(np.int64)
+        data['T'] = df['T'].values
+        data.sort(order='hour')
+
+        return cls(data)
+
+    @classmethod
+    def load(cls, filepath: str):
+        return cls(np.load(filepath, mmap_mode='r'))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=cls.DTYPE))
+
+    def save(self, filepath: str):
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        np.save(filepath, self.data)
+
+    def temperature(self, input_date, max_gap = MAX_GAP_HOURS):
+        """Temperature at the full hour of input_date, NaN if the station has no reading"""
+        return self.temperatures(epoch_hours([input_date]), max_gap = max_gap)[0]
+
+    def valid(self):
+        """Hours and temperatures of all readings that are not missing"""
+        if self._valid is None:
+            self._valid = self.data[self.data['T'] != self.MISSING]
+        return self._valid
+
+    def temperatures(self, hours, max_gap = MAX_GAP_HOURS):
+        """
+        Temperatures at hours since epoch, NaN where the station has no reading.
+        Hours without reading are interpolated linearly between the readings before and after, 
+        if these are at most max_gap hours apart.
+        """
+        hours = np.asarray(hours, dtype=np.int64)
+        valid = self.valid()
+        if len(valid) == 0:
+            return np.full(hours.shape, np.nan)
+
+        # Readings at or after and before the hours
+        upper = np.searchsorted(valid['hour'], hours)
+        lower = upper - 1
+        upper_clipped = np.minimum(upper, len(valid) - 1)
+        lower_clipped = np.maximum(lower, 0)
+
+        upper_hour = valid['hour'][upper_clipped]
+        lower_hour = valid['hour'][lower_clipped]
+        upper_T = valid['T'][upper_clipped].astype(float)
+        lower_T = valid['T'][lower_clipped].astype(float)
+
+        exact = (upper < len(valid)) & (upper_hour == hours)
+        gap = (lower >= 0) & (upper < len(valid)) & (upper_hour - lower_hour <= max_gap)
+
+        weight = np.divide(
+            hours - lower_hour, upper_hour - lower_hour, 
+            out = np.zeros(hours.shape), where = upper_hour != lower_hour
+            )
+        values = np.where(exact, upper_T, np.where(gap, lower_T + weight * (upper_T - lower_T), np.nan))
+
+        return values * T_SCALINGFACTOR
+
 class ISD:
     """Downloads weatherdata from ISD Lite database"""
-    URL = 'https://www.ncei.noaa.gov/pub/data/noaa/isd-lite/'
-    ISD_HISTORY_URL = 'https://www.ncei.noaa.gov/pub/data/noaa/isd-history.csv'
-    ISD_INVENTORY_URL = 'https://www.ncei.noaa.gov/pub/data/noaa/isd-inventory.csv'
-    def __init__(self):
-        filedirectory = os.path.dirname(os.path.abspath(__file__))
-        isd_history_path = os.path.join(filedirectory, 'isd-history.csv')
-        isd_inventory_path = os.path.join(filedirectory, 'isd-inventory.csv')
-
-        # Download isd history and inventory for station finding
-        if not os.path.exists(isd_history_path) or (time.time() - os.path.getmtime(isd_history_path)) > 2592000:  
+    URL = NCEI_URL + 'pub/data/noaa/isd-lite/'
+    FTP_URL = NOAA_FTP_URL + 'isd-lite/'
+    ISD_HISTORY_URL = NCEI_URL + 'pub/data/noaa/isd-history.csv'
+    ISD_INVENTORY_URL = NCEI_URL + 'pub/data/noaa/isd-inventory.csv'
+    def __init__(self, max_gap = MAX_GAP_HOURS):
+        # Gaps in the readings of a station up to max_gap hours are interpolated
+        self.max_gap = max_gap
+
+        isd_history_path = cache.path('isd-history', 'isd-history.csv')
+        isd_inventory_path = cache.path('isd-history', 'isd-inventory.csv')
+
+        # Download isd history and inventory for station finding, expired files are downloaded again
+        if not cache.fresh(isd_history_path):
             self._download(self.ISD_HISTORY_URL, isd_history_path) 
-        if not os.path.exists(isd_inventory_path) or (time.time() - os.path.getmtime(isd_inventory_path)) > 2592000:
+        if not cache.fresh(isd_inventory_path):
             self._download(self.ISD_INVENTORY_URL, isd_inventory_path) 
 
-        self.isd_history = pd.read_csv(isd_history_path, dtype={'USAF': str, 'WBAN': str})
-        self.isd_inventory = pd.read_csv(isd_inventory_path, dtype={'USAF': str, 'WBAN': str})
-        # Remove stations that do not have a location
-        self.isd_history = self.isd_history[self.isd_history.LAT.notnull()]
+        self.stations = StationIndex.load(isd_history_path, isd_inventory_path)
         self.reset_possible_stations()
 
     def reset_possible_stations(self):
         """Possibile stations are used for finding closest station with weatherdata"""
-        self.possible_stations = copy.deepcopy(self.isd_history)
+        self.excluded_stations = set()
 
     def _download(self, fileurl: str, targetpath: str):
         if not os.path.exists(targetpath):
             print('Downloading file from: \n' + fileurl)
-            r = requests.get(fileurl, allow_redirects=True)
-            with open(targetpath, 'wb') as outfile:
-                outfile.write(r.content)
+            get_downloader().fetch(fileurl, targetpath)
             print('Download finished')
 
     def find_station(self, input_date, lat: float, lon: float):
         """Finds nearest station by lat and lon that has data for specified date"""
-        # Remove all stations which have no records at the desired date
-        date_int = int(input_date.strftime('%Y%m%d'))
-        self.possible_stations = self.possible_stations[self.possible_stations.BEGIN < date_int]
-        self.possible_stations = self.possible_stations[self.possible_stations.END > date_int]
-
-        if self.possible_stations.empty:
-            raise ValueError('No station available for query datetime')
-
-        while True:
-            coordinates = self.possible_stations[['LAT', 'LON']].values
-
-            # Search for closest station
-            tree = spatial.cKDTree(coordinates)
-            index_next_station = tree.query([(lat,lon)])[1][0]
-
-            # Get dataframe entry of closest station
-            station = self.possible_stations[
-                (self.possible_stations.LAT == coordinates[index_next_station][0]) & 
-                (self.possible_stations.LON == coordinates[index_next_station][1])
-                ]
-
-            # Get data inventory of closest station
-            inventory = self.isd_inventory.loc[
-                (self.isd_inventory['USAF'] == station['USAF'].values[0]) &
-                (self.isd_inventory['YEAR'] == input_date.year)
-                ]
-            
-            # Abbreviation of desired month to search pandas dataframe
-            month = str.upper(calendar.month_abbr[input_date.month])
-            # Amount of days in the desired month, used to check for full dataset
-            days_in_month = calendar.monthrange(input_date.year, input_date.month)[1]
-
-            # Check if the dataset of the station has hourly data for that month
-            if not inventory.empty:
-                if inventory[month].values[0]/days_in_month >= 24:
-                    break
-                
-            # Remove the current station from possible stations and search again
-            index = self.possible_stations.loc[
-                (self.possible_stations['USAF'] == station['USAF'].values[0]) & 
-                (self.possible_stations['WBAN'] == station['WBAN'].values[0])
-                ].index.item()
-
-            self.possible_stations = self.possible_stations.drop([index])
-
-        return station
+        index, _ = self.stations.nearest(input_date, lat, lon, exclude = self.excluded_stations)
+        return self.stations.station(index)
 
     def temperature(self, input_date, lat: float, lon: float, output_station = False, ftp = False, output_distance = False):
         # Round to the next full hour, because database has data for full hours
@@ -119,45 +372,26 @@ class ISD:
         # Sometimes the station has no data for the datetime, thus the loop
         retry = True
         while retry:
-            station = self.find_station(input_date, lat, lon)
-            # Calculate distance from query location to the station
-            coords_station = np.array([station['LAT'].iloc[0], station['LON'].iloc[0]])
-            coords_query = np.array([lat, lon])
-            distance = geopy.distance.distance(coords_station, coords_query).km
+            index, distance = self.stations.nearest(input_date, lat, lon, exclude = self.excluded_stations)
+            station = self.stations.station(index)
 
-            if distance > 300:            
+            if distance > MAX_STATION_DISTANCE:
                 print(
                     '{0}: Distance from {1}, {2} to closest weatherstation is {3} km. No data at query location available'.format(
                         input_date, round(lat, 3), round(lon, 3), round(distance, 2))
                         )
                 temperature = float('nan')
-                self.possible_stations = self.possible_stations.drop([station.index[0]])
+                self.excluded_stations.add(index)
                 break
             
-            col_names = ['Year', 'Month', 'Day', 'Hour', 'T']
-            filename = '{0}-{1}-{2}.gz'.format(station['USAF'].iloc[0], station['WBAN'].iloc[0], input_date.year)
-
-            # Download files with ftp connection
-            if ftp:
-                filepath = self._download_weatherdata_ftp(filename, input_date.year)
-            # Else use https url
-            else:
-                # e.g .../2019/010020-99999-2019.gz
-                filepath = self.URL + str(input_date.year) + '/' + filename
+            filename = self.stations.filename(index, input_date.year)
+            temperature = self.station_year(filename, input_date.year, ftp = ftp).temperature(input_date, self.max_gap)
 
-            df = pd.read_csv(
-                    filepath, parse_dates={'Date': ['Year', 'Month', 'Day', 'Hour']}, 
-                    compression='gzip', quotechar='"', delim_whitespace=True, usecols=[0,1,2,3,4], names=col_names
-                    )
-
-            df = df[df.Date.between(input_date, input_date)]
-
-            # If the dataframe is empty or temperature value is faulty, station has no data for datetime and is removed from isd_history
-            if df.empty or (df['T'].values[0] == -9999):
-                self.possible_stations = self.possible_stations.drop([station.index[0]])
+            # If temperature value is missing or the gap is too long, station has no data for datetime and is excluded from search
+            if np.isnan(temperature):
+                self.excluded_stations.add(index)
                 retry = True
             else:
-                temperature = df['T'].values[0] * T_SCALINGFACTOR  
                 retry = False
 
         self.reset_possible_stations()
@@ -171,148 +405,483 @@ class ISD:
         else:
             return temperature
 
-    def _connect_ftp(self):
-        """Conncect to NOAA server with ftp connection. Retry to establish connection if it fails."""
-        retry = True
-        while (retry):
-            try:
-                ftp = ftplib.FTP('ftp.ncei.noaa.gov')
-                ftp.login()
-                ftp.cwd('pub/data/noaa')
-                retry = False
+    def temperatures(self, datetimes, lat, lon, ftp = False):
+        """
+        Get temperatures and distances to the stations for many waypoints at once.
 
-            except EOFError as e:
-                print(e)
-                print("Connection to NOAA server failed. Retrying to connect.")
-                retry = True
+        Waypoints are grouped by day and resolved together: all candidate stations are 
+        found with one k-nearest query per day and every station-year file is read once. 
+        Waypoints move on to their next candidate only if the station has no reading 
+        and the gap in its readings is longer than max_gap.
+        """
+        dates = [hour_rounder(input_date) for input_date in datetimes]
+        hours = epoch_hours(dates)
+        temperatures = np.full(len(dates), np.nan)
+        distances = np.full(len(dates), np.nan)
 
-            except OSError as e:
-                print(e)
-                print("Connection to NOAA server failed. Retrying to connect.")
-                retry = True
+        groups = self._groups(dates, lat, lon)
+        while any(group['pending'].size for group in groups):
+            files = self._next_round(groups, lat, lon)
+
+            # Download files of all candidate stations of this round concurrently
+            if ftp:
+                self.prefetch(files)
 
-        return ftp
+            for group in groups:
+                self._evaluate(
+                    group, hours, temperatures, distances, 
+                    lambda filename, year: self.station_year(filename, year, ftp = ftp)
+                    )
+
+        return temperatures, distances
+
+    def _groups(self, dates, lat, lon):
+        """Group waypoints by day and query their candidate stations"""
+        groups = []
+        for day, rows in group_by_day(dates).items():
+            candidates, candidate_distances, complete = self.stations.query(
+                day, lat[rows], lon[rows], StationIndex.K, MAX_STATION_DISTANCE
+                )
+            groups.append({
+                'day': day, 'rows': rows, 'k': StationIndex.K,
+                'candidates': candidates, 'distances': candidate_distances, 'complete': complete,
+                'position': np.zeros(len(rows), dtype=int), 'pending': np.arange(len(rows))
+                })
+        return groups
+
+    def _next_round(self, groups, lat, lon):
+        """
+        Select the next candidate stations of all groups.
+
+        Returns:
+            set of (filename, year) of the station-year files needed in this round
+        """
+        for group in groups:
+            self._next_candidates(group, lat, lon)
+        return {
+            (self.stations.filename(station, group['day'].year), group['day'].year) 
+            for group in groups for station in group['stations']
+            }
+
+    def _evaluate(self, group, hours, temperatures, distances, series):
+        """
+        Read temperatures of the candidate stations of a group, 
+        series returns the StationYear for a filename and year
+        """
+        rows, pending, position = group['rows'], group['pending'], group['position']
+        year = group['day'].year
+        for station in np.unique(group['stations']):
+            selection = pending[group['stations'] == station]
+            values = series(self.stations.filename(station, year), year).temperatures(hours[rows[selection]], self.max_gap)
+
+            found = ~np.isnan(values)
+            temperatures[rows[selection[found]]] = values[found]
+            distances[rows[selection[found]]] = group['distances'][selection[found], position[selection[found]]]
+            position[selection[~found]] += 1
+
+        group['pending'] = pending[np.isnan(temperatures[rows[pending]])]
+
+    def blended_temperatures(self, datetimes, lat, lon, k = 4, method = 'idw', ftp = False):
+        """
+        Get temperatures for many waypoints by interpolating between the k nearest stations 
+        with data at the waypoint's hour. 
+
+        Candidate stations are found with one query per day, all their station-year files 
+        are read once and the weights of all waypoints are calculated at once.
+
+        Args:
+            k: number of stations blended for each waypoint
+            method: 'idw' for inverse distance weighting, 'kriging' for ordinary kriging 
+                with an exponential covariance of fixed range
+
+        Returns:
+            temperatures and distances to the nearest used station
+        """
+        dates = [hour_rounder(input_date) for input_date in datetimes]
+        hours = epoch_hours(dates)
+        groups = self._groups(dates, lat, lon)
+
+        if ftp:
+            self.prefetch(self._candidate_files(groups))
 
-    def _download_ftp(self, source_file: str, target_file: str):
-        """Downlaod a file from the ftp server and save it in the target file"""
-        try:
-            ftp = self._connect_ftp()
-            with open(target_file, 'wb+') as fh:
-                ftp.retrbinary('RETR ' + source_file, fh.write)
+        return self._blend(
+            groups, hours, k, method, lambda filename, year: self.station_year(filename, year, ftp = ftp)
+            )
+
+    def _candidate_files(self, groups):
+        """Set of (filename, year) of the station-year files of all candidate stations"""
+        return {
+            (self.stations.filename(station, group['day'].year), group['day'].year)
+            for group in groups for station in np.unique(group['candidates'][group['candidates'] >= 0])
+            }
 
-        except ftplib.all_errors as e:
-            print('FTP error:', e) 
+    def _blend(self, groups, hours, k, method, series):
+        """Blend the candidate stations of all groups, series returns the StationYear for a filename and year"""
+        temperatures = np.full(len(hours), np.nan)
+        distances = np.full(len(hours), np.nan)
+
+        for group in groups:
+            rows, candidates = group['rows'], group['candidates']
+            year = group['day'].year
+
+            # Temperatures of all candidates at the hours of the waypoints
+            values = np.full(candidates.shape, np.nan)
+            for station in np.unique(candidates[candidates >= 0]):
+                index_row, index_candidate = np.nonzero(candidates == station)
+                values[index_row, index_candidate] = series(self.stations.filename(station, year), year).temperatures(
+                    hours[rows[index_row]], self.max_gap
+                    )
+
+            # Use the k nearest candidates with data
+            valid = ~np.isnan(values)
+            use = valid & (np.cumsum(valid, axis = 1) <= k)
+            vectors = self.stations.tree.data[np.maximum(candidates, 0)]
 
-            if os.path.isfile(target_file):
-                os.remove(target_file)
+            if method == 'idw':
+                weights = idw_weights(group['distances'], use)
+            elif method == 'kriging':
+                weights = kriging_weights(group['distances'], vectors, use)
+            else:
+                raise ValueError('Interpolation method {} is not supported'.format(method))
+
+            found = use.any(axis = 1)
+            blended = np.sum(weights * np.where(use, values, 0), axis = 1)
+            temperatures[rows] = np.where(found, blended, np.nan)
+            distances[rows] = np.where(found, np.min(np.where(use, group['distances'], np.inf), axis = 1), np.nan)
+
+        return temperatures, distances
+
+    def _next_candidates(self, group, lat, lon):
+        """Select the next candidate station for all pending waypoints of a group"""
+        rows, position = group['rows'], group['position']
+        while True:
+            pending = group['pending']
+            candidates = group['candidates']
+            exhausted = position[pending] >= candidates.shape[1]
+            exhausted[~exhausted] = candidates[pending[~exhausted], position[pending[~exhausted]]] == -1
+            # Query more neighbours, if there might be more stations in range
+            if not (exhausted & ~group['complete'][pending]).any():
+                break
+            group['k'] *= 4
+            group['candidates'], group['distances'], group['complete'] = self.stations.query(
+                group['day'], lat[rows], lon[rows], group['k'], MAX_STATION_DISTANCE
+                )
+
+        # No station with data in range, temperature stays NaN
+        group['pending'] = pending[~exhausted]
+        group['stations'] = group['candidates'][group['pending'], position[group['pending']]]
+
+    def prefetch(self, files):
+        """Download ISD Lite files concurrently, files are given as (filename, year)"""
+        get_downloader().fetch_all(self.jobs(files))
+
+    def jobs(self, files):
+        """Download jobs (fileurl, targetpath) of the files that are not cached yet"""
+        return [
+            (self.FTP_URL + str(year) + '/' + filename, self._filepath(filename))
+            for filename, year in files
+            if filename not in _station_years 
+            and not cache.fresh(self._sidecar(filename)) and not cache.fresh(self._filepath(filename))
+            ]
+
+    def _filepath(self, filename):
+        return cache.path('isd-lite', filename)
+
+    def _sidecar(self, filename):
+        return cache.path('isd-lite', os.path.splitext(filename)[0] + '.npy')
+
+    def station_year(self, filename: str, year: int, ftp = False):
+        """Get the parsed station-year series, cached in memory and as binary file on disk"""
+        with _station_years_lock:
+            if filename in _station_years:
+                _station_years.move_to_end(filename)
+                return _station_years[filename]
+
+        sidecar = self._sidecar(filename)
+        if cache.fresh(sidecar):
+            series = StationYear.load(sidecar)
+        else:
+            # Download files with ftp connection
+            if ftp:
+                filepath = self._download_weatherdata_ftp(filename, year)
+            # Else use https url
+            else:
+                # e.g .../2019/010020-99999-2019.gz
+                filepath = self.URL + str(year) + '/' + filename
+            try:
+                series = StationYear.read(filepath)
+                series.save(sidecar)
+            # Station is skipped for this run, if the file can not be downloaded or read
+            except (OSError, EOFError, pd.errors.EmptyDataError) as e:
+                print('Could not read {0}: {1}'.format(filename, e))
+                series = StationYear.empty()
+
+        with _station_years_lock:
+            _station_years[filename] = series
+            if len(_station_years) > STATIONYEAR_CACHESIZE:
+                _station_years.popitem(last = False)
+
+        return series
 
     def _download_weatherdata_ftp(self, filename, year):
         """Downloads weather data for the station"""
 
-        filepath = os.path.join(WEATHERDATAPATH, filename)
+        filepath = self._filepath(filename)
         
-        if not os.path.exists(filepath):
-            ftp_filepath = 'isd-lite/' + str(year) + '/' + filename
-            self._download_ftp(ftp_filepath, filepath)
+        if not cache.fresh(filepath):
+            get_downloader().fetch(self.FTP_URL + str(year) + '/' + filename, filepath)
 
         return filepath
 
 class NOAAFile(object):
     """Base class for access to NOAA server"""
+    # Available files of directory listings that were already read
+    _listings = {}
+    # Listings are read by the download workers, each listing is only read once
+    _listing_locks = {}
+    _listing_locks_lock = threading.Lock()
+
     def __init__(self, input_date):   
         self.date = input_date
 
-    def _find_file(self, url, datestring, extension):
+    @classmethod
+    def _find_file(cls, url, datestring, extension):
         """Find url for data file for input_date"""
+        with NOAAFile._listing_locks_lock:
+            lock = NOAAFile._listing_locks.setdefault(url, threading.Lock())
+        with lock:
+            if url not in NOAAFile._listings:
+                page = get_downloader().get_text(url)
+                soup = BeautifulSoup(page, 'html.parser')
+                NOAAFile._listings[url] = [
+                    url + '/' + node.get('href') for node in soup.find_all('a') if node.get('href').endswith(extension)
+                    ]
+
+        return next((s for s in NOAAFile._listings[url] if datestring in s), None) 
+
+    @classmethod
+    def _jobs(cls, dates):
+        """Download jobs (fileurl, targetpath) for all dates, directory listings are read once per month"""
+        months = {input_date.strftime('%Y%m'): input_date for input_date in dates}
+        list(get_downloader().executor.map(cls.fileurl, months.values()))
+
+        jobs = []
+        for input_date in dates:
+            fileurl = cls.fileurl(input_date)
+            if fileurl is not None and not cache.fresh(cls.targetpath(input_date, fileurl)):
+                jobs.append((fileurl, cls.targetpath(input_date, fileurl)))
+        return jobs
+
+    @classmethod
+    def prefetch(cls, dates):
+        """Download the files for all dates concurrently"""
+        get_downloader().fetch_all(cls.jobs(dates))
 
-        page = requests.get(url).text
-        soup = BeautifulSoup(page, 'html.parser')
-        available_files = [url + '/' + node.get('href') for node in soup.find_all('a') if node.get('href').endswith(extension)]
+    def _download(self, fileurl: str, targetpath: str):
+        if not cache.fresh(targetpath):
+            get_downloader().fetch(fileurl, targetpath)
 
-        return next((s for s in available_files if datestring in s), None) 
+class ShipReports:
+    """
+    Air temperature reports of one monthly ICOADS file as compact columns.
+    Timestamps are saved as seconds since epoch, coordinates in degrees and temperatures in Celsius.
 
-    def _download(self, fileurl: str, targetpath: str):
-            r = requests.get(fileurl, allow_redirects=True)
-            with open(targetpath, 'wb') as outfile:
-                outfile.write(r.content)
+    Reports are sorted by time and bucketed by hour. A spatial index of each hour bucket 
+    is built on first use, so nearest report queries only search the buckets in the time window.
+    """
+    COLUMNS = {'time': 'i8', 'lat': 'f4', 'lon': 'f4', 'T': 'f4'}
+    BUCKET = 3600
+    # Maximum number of pairs of query point and report compared directly at once
+    PAIRS = 1 << 20
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.time = columns['time']
+        self.vectors = unit_vectors(columns['lat'], columns['lon']) if len(self.time) else np.empty((0, 3))
+        self._trees = {}
+
+    @classmethod
+    def read(cls, source):
+        """
+        Parse the fixed-width IMMA records of a gzipped ICOADS file line by line, 
+        only date, position and air temperature are extracted. See IMMA_format.pdf in doc.
+        """
+        columns = {key: [] for key in cls.COLUMNS}
+        with gzip.open(source, 'rb') as fh:
+            for line in fh:
+                try:
+                    day = datetime(int(line[0:4]), int(line[4:6]), int(line[6:8]))
+                    # hours are saved in hundredths, 0.01 * 3600 to transform into seconds
+                    seconds = int(line[8:12]) * 36
+                    lat = int(line[12:17]) * 0.01
+                    lon = int(line[17:23]) * 0.01
+                    T = int(line[69:73]) * T_SCALINGFACTOR
+                # drop all reports with missing date, position or temperature
+                except ValueError:
+                    continue
+                columns['time'].append(calendar.timegm(day.timetuple()) + seconds)
+                columns['lat'].append(lat)
+                columns['lon'].append(lon)
+                columns['T'].append(T)
+
+        columns = {key: np.array(values, dtype=cls.COLUMNS[key]) for key, values in columns.items()}
+        order = np.argsort(columns['time'], kind='stable')
+        return cls({key: values[order] for key, values in columns.items()})
+
+    @classmethod
+    def load(cls, directory: str):
+        return cls({key: np.load(os.path.join(directory, key + '.npy'), mmap_mode='r') for key in cls.COLUMNS})
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok = True)
+        for key, values in self.columns.items():
+            np.save(os.path.join(directory, key + '.npy'), values)
+
+    def _tree(self, bucket):
+        """Spatial index of the reports in an hour bucket"""
+        if bucket not in self._trees:
+            start, end = np.searchsorted(self.time, [bucket * self.BUCKET, (bucket + 1) * self.BUCKET])
+            self._trees[bucket] = (start, spatial.cKDTree(self.vectors[start:end]) if end > start else None)
+        return self._trees[bucket]
+
+    def nearest(self, times, lat, lon, window: int):
+        """
+        Find the nearest report within +- window seconds for many query points.
+
+        Hour buckets completely inside a time window are searched with their spatial index, 
+        the reports in the partially covered buckets at both ends are compared directly.
+
+        Returns:
+            indices of the reports, -1 where no report is in the time window, and distances in km
+        """
+        times = np.asarray(times, dtype=np.int64)
+        vectors = unit_vectors(lat, lon)
+        indices = np.full(len(times), -1)
+        chords = np.full(len(times), np.inf)
+        if len(times) == 0:
+            return indices, np.full(0, np.nan)
+
+        start, end = times - window, times + window
+        # Buckets completely inside the time windows, none if first > last
+        first = -(-start // self.BUCKET)
+        last = (end + 1) // self.BUCKET - 1
+        full = first <= last
+
+        if full.any():
+            for bucket in range(first[full].min(), last[full].max() + 1):
+                offset, tree = self._tree(bucket)
+                selection = np.flatnonzero(full & (first <= bucket) & (bucket <= last))
+                if tree is None or selection.size == 0:
+                    continue
+                chord, index = tree.query(vectors[selection])
+                better = chord < chords[selection]
+                indices[selection[better]] = index[better] + offset
+                chords[selection[better]] = chord[better]
+
+        # Reports at the edges of the time windows, the whole window if no bucket is completely inside
+        lower_end = np.where(full, first * self.BUCKET, end + 1)
+        upper_start = np.where(full, (last + 1) * self.BUCKET, end + 1)
+        queries = np.arange(len(times))
+        self._compare(
+            np.concatenate([queries, queries]), vectors,
+            np.searchsorted(self.time, np.concatenate([start, upper_start]), 'left'),
+            np.searchsorted(self.time, np.concatenate([lower_end, end + 1]), 'left'),
+            indices, chords
+            )
+
+        return indices, np.where(indices >= 0, chord_to_km(chords), np.nan)
+
+    def _compare(self, queries, vectors, starts, ends, indices, chords):
+        """
+        Compare the reports in the index ranges starts to ends directly with the query points, 
+        indices and chords of the nearest reports are updated. All ranges are compared at once 
+        in blocks of at most PAIRS pairs of query point and report.
+        """
+        counts = np.maximum(ends - starts, 0)
+        nonempty = np.flatnonzero(counts)
+        if nonempty.size == 0:
+            return
+        cumulative = np.cumsum(counts[nonempty])
+        splits = np.searchsorted(cumulative, np.arange(self.PAIRS, cumulative[-1], self.PAIRS), 'right')
+
+        for block in np.split(nonempty, splits):
+            if block.size == 0:
+                continue
+            block_counts = counts[block]
+            query = np.repeat(queries[block], block_counts)
+            report = np.repeat(starts[block] - np.cumsum(block_counts) + block_counts, block_counts) \
+                + np.arange(block_counts.sum())
+            chord = np.linalg.norm(self.vectors[report] - vectors[query], axis = 1)
+
+            # Nearest report of each query point, first pair after sorting by query point and chord
+            order = np.lexsort((chord, query))
+            nearest = order[np.r_[True, query[order][1:] != query[order][:-1]]]
+            better = chord[nearest] < chords[query[nearest]]
+            indices[query[nearest][better]] = report[nearest][better]
+            chords[query[nearest][better]] = chord[nearest][better]
+
+    def temperatures(self, times, lat, lon, window: int):
+        """Temperatures and distances of the nearest reports within +- window seconds, NaN if there is none"""
+        indices, distances = self.nearest(times, lat, lon, window)
+        values = self.columns['T'][np.maximum(indices, 0)].astype(float) if len(self.time) else np.zeros(len(indices))
+        return np.where(indices >= 0, values, np.nan), distances
 
 class ICOADSFile(NOAAFile):
     """
     Class to handle files from NOAA International Comprehensive Ocean-Atmosphere Data Set.
     See also: https://icoads.noaa.gov/index.shtml
     """
+    URL = NCEI_URL + 'data/international-comprehensive-ocean-atmosphere/v3/archive/enhanced-trim/'
+    # Reports within this time window around the query time are used
+    WINDOW = timedelta(hours = 3)
+
     def __init__(self, input_date, download = True):
 
         super(ICOADSFile, self).__init__(input_date)
-        url = 'https://www.ncei.noaa.gov/data/international-comprehensive-ocean-atmosphere/v3/archive/enhanced-trim/'
-        datestring = 'd' + input_date.strftime('%Y%m')
-        fileurl = self._find_file(url, datestring, 'gz')
-        filename = 'ICOADS_' + self.date.strftime('%Y%m') + '.dat.gz'
-        targetpath = os.path.join(WEATHERDATAPATH, filename)
+        fileurl = self.fileurl(input_date)
+        targetpath = self.targetpath(input_date, fileurl)
+        cachepath = targetpath.replace('.dat.gz', '')
 
-        if download:
+        if cache.fresh(cachepath):
+            self.reports = ShipReports.load(cachepath)
+        elif download:
             self._download(fileurl, targetpath)
-            readfile = targetpath
+            self.reports = ShipReports.read(targetpath)
+            self.reports.save(cachepath)
         else: 
-            readfile = fileurl
-
-        self.dataframe = self._read(readfile)
-
-    def _read(self, ICOADSfile):
-
-        # character lengths of columns and scaling factors for values, see IMMA_format.pdf in doc
-        COL_LENGTHS = {
-            'YR': range(0, 4), 'MO': range(4, 6), 'DY': range(6, 8), 'HR': range(8, 12),
-            'Lat': range(12,17), 'Lon': range(17, 23), 'T': range(69, 73)
-            }
-        
-        SCALINGFACTORS = {
-            'T': T_SCALINGFACTOR,
-            'Lat': 0.01,
-            'Lon': 0.01,
-            'HR': 36 # 0.01* 3600 to transform into seconds
-        }
-
-        dateparse = lambda x: datetime.strptime(x, '%Y %m %d')
-
-        df = pd.read_fwf(
-            ICOADSfile, parse_dates={'date': ['YR', 'MO', 'DY']}, date_parser=dateparse,
-            colspecs=[(min(x), max(x)+1) for x in COL_LENGTHS.values()],
-            header=None, names=COL_LENGTHS.keys()
-            )
-
-        # drop all readings without temperature readings
-        df = df[df['T'].notna()]
-
-        for key in SCALINGFACTORS:
-            df[key] = df[key] * SCALINGFACTORS[key]
-
-        # add time to date
-        df['HR'] = pd.to_timedelta(df['HR'], 's')  
-        df['date'] = df['date'] + df['HR']
-        df = df.drop(columns = ['HR'])
-
-        return df
+            self.reports = ShipReports.read(urlopen(fileurl))
+
+    @classmethod
+    def fileurl(cls, input_date):
+        return cls._find_file(cls.URL, 'd' + input_date.strftime('%Y%m'), 'gz')
+
+    @staticmethod
+    def targetpath(input_date, fileurl):
+        return cache.path('icoads', 'ICOADS_' + input_date.strftime('%Y%m') + '.dat.gz')
+
+    @classmethod
+    def jobs(cls, dates):
+        """Download jobs of the monthly files for all dates"""
+        months = {input_date.strftime('%Y%m'): input_date for input_date in dates}
+        return cls._jobs(list(months.values()))
+
+    @property
+    def dataframe(self):
+        """Reports as dataframe with columns date, Lat, Lon and T"""
+        columns = self.reports.columns
+        return pd.DataFrame({
+            'date': pd.to_datetime(np.asarray(columns['time']), unit='s'),
+            'Lat': columns['lat'], 'Lon': columns['lon'], 'T': columns['T']
+            })
 
     def temperature(self, input_datetime, lat, lon):
+        """Temperature of the nearest report within the time window and distance to it"""
+        temperatures, distances = self.temperatures([input_datetime], [lat], [lon])
+        return temperatures[0], distances[0]
 
-            # df = copy.deepcopy(self.dataframe)
-            df = self.dataframe
-
-            df = df[df.date.between(
-                input_datetime - timedelta(hours = 3),
-                input_datetime + timedelta(hours = 3)
-                )]
-
-            coordinates = df[['Lat', 'Lon']].values
-
-            # Search for closest reading
-            tree = spatial.KDTree(coordinates)
-            index = tree.query([(lat,lon)])[1][0]
-
-            distance = geopy.distance.distance([lat, lon], coordinates[index]).km
- 
-            return df.iloc[index]['T'], distance
+    def temperatures(self, datetimes, lat, lon):
+        """Temperatures of the nearest reports for many waypoints, NaN where no report is in the time window"""
+        return self.reports.temperatures(epoch_seconds(datetimes), lat, lon, int(self.WINDOW.total_seconds()))
 
 class OISSTFile(NOAAFile):
     """
@@ -324,21 +893,73 @@ class OISSTFile(NOAAFile):
     https://towardsdatascience.com/read-netcdf-data-with-python-901f7ff61648
     https://iescoders.com/reading-netcdf4-data-in-python/
     """
+    URL = NCEI_URL + 'data/sea-surface-temperature-optimum-interpolation/v2.1/access/avhrr/{}'
+
     def __init__(self, input_date):
         super(OISSTFile, self).__init__(input_date)
-         
-        url = 'https://www.ncei.noaa.gov/data/sea-surface-temperature-optimum-interpolation/v2.1/access/avhrr/{}'
 
+        fileurl = self.fileurl(input_date)
+        self.filepath = self.targetpath(input_date, fileurl)
+
+        self._download(fileurl, self.filepath)
+
+        self._dataset = None
+        self.sst = self._load_sst()
+
+    @classmethod
+    def open(cls, input_date):
+        """Get file for the day of input_date, recently used days are kept open"""
+        day = input_date.strftime('%Y%m%d')
+        with _oisst_files_lock:
+            if day in _oisst_files:
+                _oisst_files.move_to_end(day)
+                return _oisst_files[day]
+
+        OISST = cls(input_date)
+
+        with _oisst_files_lock:
+            # Another thread may have opened the same day in the meantime
+            OISST = _oisst_files.setdefault(day, OISST)
+            _oisst_files.move_to_end(day)
+            if len(_oisst_files) > OISST_CACHESIZE:
+                _oisst_files.popitem(last = False)
+        return OISST
+
+    @property
+    def dataset(self):
+        """netCDF dataset of the file, only opened when accessed"""
+        with _netcdf_lock:
+            if self._dataset is None:
+                self._dataset = nc.Dataset(self.filepath)
+        return self._dataset
+
+    def _load_sst(self):
+        """
+        Memory-map the sst slice of the file. The slice is extracted once into a binary 
+        file next to the netCDF file, cells on land are NaN.
+        """
+        sstpath = os.path.splitext(self.filepath)[0] + '-sst.npy'
+        if not cache.fresh(sstpath):
+            with _netcdf_lock:
+                sst = self.dataset['sst'][0, 0]
+            np.save(sstpath, np.ma.filled(sst.astype(np.float32), np.nan))
+        return np.load(sstpath, mmap_mode = 'r')
+
+    @classmethod
+    def fileurl(cls, input_date):
         folderstring = input_date.strftime('%Y%m')
         datestring = input_date.strftime('%Y%m%d')
+        return cls._find_file(cls.URL.format(folderstring), datestring, 'nc')
 
-        fileurl = self._find_file(url.format(folderstring), datestring, 'nc')
-        filename = os.path.basename(fileurl)
-        targetpath = os.path.join(WEATHERDATAPATH, filename)
+    @staticmethod
+    def targetpath(input_date, fileurl):
+        return cache.path('oisst', os.path.basename(fileurl))
 
-        self._download(fileurl, targetpath)
-        
-        self.dataset = nc.Dataset(targetpath)
+    @classmethod
+    def jobs(cls, dates):
+        """Download jobs of the daily files for all dates"""
+        days = {input_date.strftime('%Y%m%d'): input_date for input_date in dates}
+        return cls._jobs(list(days.values()))
 
     def sea_surface_temperature(self, lat, lon):
         """
@@ -374,33 +995,341 @@ class OISSTFile(NOAAFile):
             units: Celsius
             current shape = (1, 1, 720, 1440)
     """
-        # Transform longitude format
-        lon = degrees_decimal_to_east(lon)
+        temperatures, distances = self.sea_surface_temperatures(lat, lon)
+        return temperatures[0], distances[0]
+
+    def sea_surface_temperatures(self, lat, lon):
+        """
+        Read sea surface temperatures for arrays of coordinates. Only the grid cells 
+        containing the coordinates are read.
+
+        Returns:
+            temperatures, NaN for coordinates on land, and distances to the cell centers in km
+        """
+        lat = np.atleast_1d(lat)
+        lon = np.atleast_1d(lon)
+
+        # Data points lie on a uniform grid, cells are found by their index
+        index_lat, index_lon = grid_indices(lat, lon)
+        temperatures = self.sst[index_lat, index_lon].astype(float)
 
-        # Data points lie on a grid with 0.25° spacing, therfore closest datapoint location has to be found
-        GRIDSIZE = 0.25
+        lat_sst = (index_lat + 0.5) * OISST_GRIDSIZE - 90
+        lon_sst = (index_lon + 0.5) * OISST_GRIDSIZE
+        distances = chord_to_km(np.linalg.norm(unit_vectors(lat, lon) - unit_vectors(lat_sst, lon_sst), axis = 1))
 
-        latdivmod = divmod(lat, GRIDSIZE)
-        londivmod = divmod(lon, GRIDSIZE)
+        return temperatures, distances
 
-        lat_sst = latdivmod[0] * GRIDSIZE + round(latdivmod[1]) + GRIDSIZE / 2
-        lon_sst = londivmod[0] * GRIDSIZE + round(londivmod[1]) + GRIDSIZE / 2
+class WeatherProvider:
+    """
+    Interface of the sources of temperatures for the waypoints of a transport.
+    Providers return temperatures in Celsius and distances to the data in km, NaN where no data is found.
+    """
+    def temperatures(self, datetimes, lat, lon):
+        raise NotImplementedError
 
-        dataset_lon = self.dataset['lon'][:]
-        dataset_lat = self.dataset['lat'][:]
+    def to_dict(self):
+        raise NotImplementedError
 
-        index_lon = np.where(np.isclose(dataset_lon, lon_sst))[0]
-        index_lat = np.where(np.isclose(dataset_lat, lat_sst))[0]
+class NOAAProvider(WeatherProvider):
+    """
+    Temperatures from the NOAA databases. Waypoints that were already resolved by an earlier 
+    transport are read from the waypoint memo. All other waypoints are resolved with ISD stations 
+    first. With use_ICOADS, ship reports are searched once per month for the remaining waypoints. 
+    Sea surface temperature is read once per day for the waypoints that are still missing.
+    """
+    def __init__(self, use_ICOADS = False, max_gap = MAX_GAP_HOURS, interpolation = None, stations = 4):
+        self.use_ICOADS = use_ICOADS
+        self.max_gap = max_gap
+        # Blend the nearest stations with 'idw' or 'kriging' instead of using the nearest station
+        self.interpolation = interpolation
+        self.stations = stations
+
+    @property
+    def isd_source(self):
+        """Source of ISD values in the waypoint memo, values of other parameters are not shared"""
+        if self.interpolation is None:
+            source = 'isd'
+        elif self.interpolation == 'idw':
+            source = 'isd-idw-k{0}-p{1}'.format(self.stations, IDW_POWER)
+        else:
+            source = 'isd-{0}-k{1}-r{2}-n{3}'.format(self.interpolation, self.stations, KRIGING_RANGE, KRIGING_NUGGET)
+        return '{0}-gap{1}'.format(source, self.max_gap)
+
+    @property
+    def memo_sources(self):
+        """Memo keys of the sources by source in the order they are tried"""
+        sources = [self.isd_source, 'icoads', 'oisst'] if self.use_ICOADS else [self.isd_source, 'oisst']
+        return dict(zip(sources, memo_keys(sources)))
+
+    def temperatures(self, datetimes, lat, lon):
+        with WaypointMemo() as memo:
+            result = self._lookup(memo, datetimes, lat, lon)
+            todo = result['todo']
+
+            if todo.size:
+                isd = ISD(max_gap = self.max_gap)
+                if self.interpolation is None:
+                    result['temperatures'][todo], result['distances'][todo] = isd.temperatures(
+                        [datetimes[i] for i in todo], lat[todo], lon[todo], ftp = True
+                        )
+                else:
+                    result['temperatures'][todo], result['distances'][todo] = isd.blended_temperatures(
+                        [datetimes[i] for i in todo], lat[todo], lon[todo], 
+                        k = self.stations, method = self.interpolation, ftp = True
+                        )
+                self._found(result, todo, self.isd_source)
+
+            # Use reports of ships nearby for waypoints without weather station nearby
+            if self.use_ICOADS:
+                months = self._missing(result, datetimes, '%Y%m')
+                ICOADSFile.prefetch([datetimes[rows[0]] for rows in months.values()])
+                for rows in months.values():
+                    self._icoads(ICOADSFile(datetimes[rows[0]]), result, datetimes, lat, lon, rows)
+
+            # Use sea surface temperature for remaining waypoints
+            days = self._missing(result, datetimes, '%Y%m%d')
+            OISSTFile.prefetch([datetimes[rows[0]] for rows in days.values()])
+            for rows in days.values():
+                self._oisst(OISSTFile.open(datetimes[rows[0]]), result, lat, lon, rows)
+
+            self._store(memo, result, lat, lon)
+
+        return result['temperatures'], result['distances']
+
+    def _lookup(self, memo, datetimes, lat, lon):
+        """Read memoized waypoints, the other waypoints have to be resolved"""
+        hours = epoch_hours([hour_rounder(input_date) for input_date in datetimes])
+        temperatures, distances, found_sources = memo.lookup(hours, lat, lon, list(self.memo_sources.values()))
+        return {
+            'hours': hours, 'temperatures': temperatures, 'distances': distances, 
+            'sources': found_sources, 'todo': np.flatnonzero(found_sources == None)
+            }
 
-        temperature = self.dataset['sst'][0,0, index_lat, index_lon][0][0]
-        distance = geopy.distance.distance([lat, lon], [lat_sst, lon_sst]).km
+    def _found(self, result, rows, source):
+        """Set source of the waypoints in rows that were resolved"""
+        rows = np.asarray(rows)
+        result['sources'][rows[~np.isnan(result['temperatures'][rows])]] = self.memo_sources[source]
+
+    def _missing(self, result, datetimes, period: str):
+        """Group waypoints without temperature by period, e.g. '%Y%m' for months"""
+        groups = {}
+        for i in np.flatnonzero(np.isnan(result['temperatures'])):
+            groups.setdefault(datetimes[i].strftime(period), []).append(i)
+        return {key: np.array(rows) for key, rows in groups.items()}
+
+    def _icoads(self, ICOADS, result, datetimes, lat, lon, rows):
+        """Use ship reports within range for waypoints of one month"""
+        reports, distances_reports = ICOADS.temperatures([datetimes[i] for i in rows], lat[rows], lon[rows])
+        found = distances_reports <= MAX_STATION_DISTANCE
+        result['temperatures'][rows[found]] = reports[found]
+        result['distances'][rows[found]] = distances_reports[found]
+        self._found(result, rows[found], 'icoads')
+
+    def _oisst(self, OISST, result, lat, lon, rows):
+        """Use sea surface temperature for waypoints of one day"""
+        sst, distances_sst = OISST.sea_surface_temperatures(lat[rows], lon[rows])
+        found = ~np.isnan(sst)
+        result['temperatures'][rows[found]] = sst[found]
+        result['distances'][rows[found]] = distances_sst[found]
+        self._found(result, rows[found], 'oisst')
+
+    def _store(self, memo, result, lat, lon):
+        """Memoize the resolved waypoints"""
+        todo = result['todo']
+        memo.store(
+            result['hours'][todo], lat[todo], lon[todo], 
+            result['sources'][todo], result['temperatures'][todo], result['distances'][todo]
+            )
+        memo.report()
+
+    def to_dict(self):
+        return {
+            'provider': 'noaa',
+            'ICOADS': self.use_ICOADS,
+            'max_gap': self.max_gap,
+            'interpolation': self.interpolation,
+            'stations': self.stations
+            }
 
-        return temperature, distance
+class GriddedProvider(WeatherProvider):
+    """
+    Temperatures from a local NetCDF file with air temperature on a time, lat and lon grid, 
+    e.g. an extract of a reanalysis. The variable is extracted once into a binary file in the cache 
+    and memory-mapped, all waypoints are interpolated trilinearly at once. No network is needed.
+    The file is opened on the first query.
+    """
+    KELVIN = ['K', 'degK', 'kelvin', 'Kelvin']
+
+    def __init__(self, filepath: str, variable = None, filename = None):
+        self.filepath = filepath
+        self.variable = variable
+        # Name of the file in the transport json, relative to the transport directory
+        self.filename = filename if filename is not None else os.path.abspath(filepath)
+        self.data = None
+
+    def open(self):
+        """Memory-map the variable of the file, if not done yet"""
+        if self.data is not None:
+            return
+        dataset = nc.Dataset(self.filepath)
+        if self.variable is None:
+            # Use the only variable with time, lat and lon dimensions
+            self.variable = next(
+                name for name, var in dataset.variables.items() if len(var.dimensions) >= 3
+                )
+        self._load(dataset)
+        dataset.close()
+
+    def _axes(self, var):
+        """Names of the time, lat and lon dimensions of a variable"""
+        names = {}
+        for dim in var.dimensions:
+            if 'time' in dim.lower():
+                names['time'] = dim
+            elif dim.lower().startswith('lat'):
+                names['lat'] = dim
+            elif dim.lower().startswith('lon'):
+                names['lon'] = dim
+            elif len(var.group().dimensions[dim]) != 1:
+                raise ValueError('Dimension {} of {} is not supported'.format(dim, self.variable))
+        if len(names) != 3:
+            raise ValueError('Variable {} needs time, lat and lon dimensions'.format(self.variable))
+        return names
+
+    def _load(self, dataset):
+        """Memory-map the variable, extract it to the cache if the file changed since the last extraction"""
+        key = hashlib.sha1(os.path.abspath(self.filepath).encode()).hexdigest()[:8]
+        name = '{0}-{1}-{2}'.format(os.path.splitext(os.path.basename(self.filepath))[0], self.variable, key)
+        datapath = cache.path('gridded', name + '.npy')
+        axespath = cache.path('gridded', name + '-axes.npz')
+
+        if not (cache.fresh(datapath) and cache.fresh(axespath)) \
+                or os.path.getmtime(datapath) < os.path.getmtime(self.filepath):
+            self._extract(dataset, datapath, axespath)
+
+        axes = np.load(axespath)
+        self.times, self.lats, self.lons = axes['time'], axes['lat'], axes['lon']
+        self.data = np.load(datapath, mmap_mode = 'r')
+
+    def _extract(self, dataset, datapath, axespath):
+        """
+        Save the variable as (time, lat, lon) array in Celsius with ascending axes. 
+        Longitudes of global grids are wrapped by repeating the first longitude.
+        """
+        print('Extracting {0} from {1}'.format(self.variable, self.filepath))
+        var = dataset[self.variable]
+        names = self._axes(var)
+
+        time_var = dataset[names['time']]
+        times = epoch_seconds(nc.num2date(
+            time_var[:], time_var.units, getattr(time_var, 'calendar', 'standard'),
+            only_use_cftime_datetimes = False, only_use_python_datetimes = True
+            ))
+        lats = np.asarray(dataset[names['lat']][:], dtype = float)
+        lons = np.mod(np.asarray(dataset[names['lon']][:], dtype = float), 360)
+
+        order_time = np.argsort(times)
+        order_lat = np.argsort(lats)
+        order_lon = np.argsort(lons)
+        lats, lons = lats[order_lat], lons[order_lon]
+
+        step = np.median(np.diff(lons)) if len(lons) > 1 else 360
+        wrap = np.isclose(lons[-1] - lons[0] + step, 360, atol = 0.01 * step)
+        if wrap:
+            order_lon = np.append(order_lon, order_lon[0])
+            lons = np.append(lons, lons[0] + 360)
+
+        offset = -273.15 if getattr(var, 'units', '') in self.KELVIN else 0
+        # Position of the time, lat and lon dimensions, other dimensions have length one
+        positions = [var.dimensions.index(names[axis]) for axis in ['time', 'lat', 'lon']]
+
+        data = np.lib.format.open_memmap(
+            datapath, mode = 'w+', dtype = np.float32, shape = (len(times), len(lats), len(lons))
+            )
+        # Read chunks of time steps to limit memory usage
+        CHUNK = 64
+        for start in range(0, len(times), CHUNK):
+            steps = order_time[start:start + CHUNK]
+            index = [0] * len(var.dimensions)
+            index[positions[0]] = np.sort(steps)
+            index[positions[1]] = slice(None)
+            index[positions[2]] = slice(None)
+            values = np.ma.filled(var[tuple(index)].astype(np.float32), np.nan)
+            values = np.moveaxis(values, np.argsort(np.argsort(positions)), [0, 1, 2])
+            # Reorder the read time steps, which are sorted by index in the file
+            values = values[np.argsort(np.argsort(steps))]
+            data[start:start + len(steps)] = values[:, order_lat][:, :, order_lon] + offset
+        data.flush()
+        del data
+
+        np.savez(axespath, time = times[order_time], lat = lats, lon = lons)
+
+    @staticmethod
+    def _weights(axis, values):
+        """Lower indices and weights of values on an ascending axis, NaN outside of the axis"""
+        index = np.clip(np.searchsorted(axis, values, side = 'right') - 1, 0, max(len(axis) - 2, 0))
+        upper = np.minimum(index + 1, len(axis) - 1)
+        span = axis[upper] - axis[index]
+        weight = np.divide(values - axis[index], span, out = np.zeros(len(values)), where = span != 0)
+        inside = (values >= axis[0]) & (values <= axis[-1])
+        return index, upper, np.where(inside, weight, np.nan)
+
+    def temperatures(self, datetimes, lat, lon):
+        self.open()
+        times = epoch_seconds(datetimes).astype(float)
+        lat = np.asarray(lat, dtype = float)
+        # Longitudes in the range of the grid
+        lon = self.lons[0] + np.mod(np.asarray(lon, dtype = float) - self.lons[0], 360)
+
+        axes = [
+            self._weights(self.times.astype(float), times), 
+            self._weights(self.lats, lat), 
+            self._weights(self.lons, lon)
+            ]
+
+        temperatures = np.zeros(len(times))
+        # Sum over the eight corners of the cells
+        for corner in np.ndindex(2, 2, 2):
+            index = tuple(axis[1] if upper else axis[0] for axis, upper in zip(axes, corner))
+            weight = np.prod([
+                axis[2] if upper else 1 - axis[2] for axis, upper in zip(axes, corner)
+                ], axis = 0)
+            temperatures += weight * self.data[index]
+
+        # Distance to the nearest grid point
+        nearest_lat = self.lats[np.where(axes[1][2] > 0.5, axes[1][1], axes[1][0])]
+        nearest_lon = self.lons[np.where(axes[2][2] > 0.5, axes[2][1], axes[2][0])]
+        distances = chord_to_km(np.linalg.norm(
+            unit_vectors(lat, lon) - unit_vectors(nearest_lat, nearest_lon), axis = 1
+            ))
+
+        return temperatures, np.where(np.isnan(temperatures), np.nan, distances)
+
+    def to_dict(self):
+        return {
+            'provider': 'gridded',
+            'filename': self.filename,
+            'variable': self.variable
+            }
+
+def providerDecoder(obj, path = os.getcwd()):
+    """Create weather provider from the weather entry of a transport"""
+    if obj.get('provider', 'noaa') == 'gridded':
+        return GriddedProvider(
+            os.path.join(path, obj['filename']), variable = obj.get('variable'), filename = obj['filename']
+            )
+    elif obj.get('provider', 'noaa') == 'noaa':
+        return NOAAProvider(
+            use_ICOADS = obj.get('ICOADS', False), max_gap = obj.get('max_gap', MAX_GAP_HOURS),
+            interpolation = obj.get('interpolation'), stations = obj.get('stations', 4)
+            )
+    else:
+        raise ValueError('Weather provider {} is not supported'.format(obj['provider']))
 
 def temperature(input_datetime: datetime, lat: float, lon: float, use_ICOADS = False):
     """Find temperature for datetime and location."""
 
-    OISST = OISSTFile(input_datetime)
+    OISST = OISSTFile.open(input_datetime)
     sst, _ = OISST.sea_surface_temperature(lat, lon)
     coordinates_onsea = onsea(lat, lon)
 
@@ -414,58 +1343,72 @@ def temperature(input_datetime: datetime, lat: float, lon: float, use_ICOADS = F
     else:
         temperature = isd.temperature(input_datetime, lat, lon)
 
-    clear()
+    cache.prune()
 
     return temperature
 
-def waypoints_temperature(datetimes, lat, lon):
-    """ Get temperature for a series of waypoints"""
-    
-    length = lat.size
-    temperatures = np.empty(length)
-    distances = np.empty(length)
-    temperatures[:] = np.nan
-    distances[:] = np.nan
+def waypoints_temperature(datetimes, lat, lon, use_ICOADS = False, provider = None):
+    """ 
+    Get temperature for a series of waypoints from a weather provider,
+    by default from the NOAA databases.
+    """
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
 
-    isd = ISD()
-    OISST = OISSTFile(datetimes[0])
-    day = datetimes[0].day
-
-    for i in range(length):
-        # Read new OISST file if day switches
-        if day != datetimes[i].day:
-            day = datetimes[i].day
-            OISST = OISSTFile(datetimes[i])
-
-        sst, distance_sst =  OISST.sea_surface_temperature(lat[i], lon[i])
-        isd_temperature, distance_isd = isd.temperature(
-            datetimes[i], lat[i], lon[i], 
-            ftp = True, 
-            output_distance = True
-            )
+    if provider is None:
+        provider = NOAAProvider(use_ICOADS = use_ICOADS)
+    temperatures, distances = provider.temperatures(datetimes, lat, lon)
 
-        if not np.isnan(isd_temperature):
-            temperatures[i] = isd_temperature
-            distances[i] = distance_isd
-        elif isinstance(sst, np.float32):
-            temperatures[i] = sst
-            distances[i] = distance_sst
-
-        if not np.isnan(temperatures[i]):
-            print(
-                "Found temperature data for {0} at {1}, {2}: {3}".format(
-                    datetimes[i], round(lat[i], 3), round(lon[i], 3), round(temperatures[i], 1)
-                    ))
-        else:
-            print(
-                "Did not find temperature data for {0} at {1}, {2}: {3}".format(
-                    datetimes[i], round(lat[i], 3), round(lon[i], 3), round(temperatures[i], 1)
-                    ))
+    found = ~np.isnan(temperatures)
+    print('Found temperature data for {0} of {1} waypoints'.format(np.count_nonzero(found), found.size))
+    for i in np.flatnonzero(~found):
+        print(
+            "Did not find temperature data for {0} at {1}, {2}".format(
+                datetimes[i], round(lat[i], 3), round(lon[i], 3)
+                ))
 
-    clear()
+    cache.prune()
 
     return np.around(temperatures, 2), distances
 
+def idw_weights(distances, use, power = IDW_POWER):
+    """
+    Inverse distance weights of the used stations of each waypoint, rows sum up to one.
+    Distances are clipped at 10 m, so a station at the waypoint dominates.
+    """
+    weights = np.where(use, 1 / np.maximum(np.where(use, distances, 1), 0.01) ** power, 0)
+    total = weights.sum(axis = 1, keepdims = True)
+    return np.divide(weights, total, out = np.zeros(weights.shape), where = total > 0)
+
+def kriging_weights(distances, vectors, use, range_km = KRIGING_RANGE, nugget = KRIGING_NUGGET):
+    """
+    Ordinary kriging weights of the used stations of each waypoint with an exponential covariance.
+    The kriging systems of all waypoints are solved at once, unused stations get zero weight.
+
+    Args:
+        distances: distances from the waypoints to the stations in km, shape (n, k)
+        vectors: unit vectors of the stations, shape (n, k, 3)
+        use: mask of the used stations, shape (n, k)
+    """
+    n, k = use.shape
+    station_distances = chord_to_km(np.linalg.norm(vectors[:, :, None, :] - vectors[:, None, :, :], axis = 3))
+    covariance = (1 - nugget) * np.exp(-station_distances / range_km)
+    covariance[:, np.arange(k), np.arange(k)] = 1
+
+    pair = use[:, :, None] & use[:, None, :]
+    system = np.zeros((n, k + 1, k + 1))
+    system[:, :k, :k] = np.where(pair, covariance, np.eye(k))
+    # Lagrange multiplier for the weights summing up to one
+    system[:, :k, k] = use
+    system[:, k, :k] = use
+    system[:, k, k] = np.where(use.any(axis = 1), 0, 1)
+
+    rhs = np.zeros((n, k + 1))
+    rhs[:, :k] = np.where(use, (1 - nugget) * np.exp(-np.where(use, distances, 0) / range_km), 0)
+    rhs[:, k] = use.any(axis = 1)
+
+    return np.linalg.solve(system, rhs[:, :, None])[:, :k, 0]
+
 def degrees_decimal_to_east(lon):
     """
     Transform longitude in decimal format to degrees east.
@@ -476,25 +1419,53 @@ def degrees_decimal_to_east(lon):
     degrees east:
     237.38542 
     """
-    if lon < 0:
-        lon = 360 - abs(lon)
+    return np.mod(lon, 360)
 
-    return lon
+def grid_indices(lat, lon):
+    """
+    Indices of the cells of the uniform OISST grid containing the coordinates. 
+    Latitudes from -89.875 to 89.875 and longitudes from 0.125 to 359.875 by 0.25.
+    """
+    index_lat = np.clip(np.floor((np.asarray(lat) + 90) / OISST_GRIDSIZE).astype(int), 0, OISST_SHAPE[0] - 1)
+    index_lon = np.floor(degrees_decimal_to_east(lon) / OISST_GRIDSIZE).astype(int) % OISST_SHAPE[1]
+    return index_lat, index_lon
+
+def landsea_mask():
+    """
+    Get the land/sea mask on the OISST grid, True for cells on sea.
+    Cells without sea surface temperature in OISST are on land. The mask is 
+    derived once from an OISST file and saved as bits in the cache.
+    """
+    global _landsea_mask
+    if _landsea_mask is None:
+        maskpath = cache.path('landsea', 'landsea-mask.npy')
+        if not cache.fresh(maskpath):
+            # Use file from ten days ago to definetly get file
+            OISST = OISSTFile.open(date.today() - timedelta(days = 10))
+            mask = ~np.isnan(OISST.sst)
+            np.save(maskpath, np.packbits(mask, axis = 1))
+        bits = np.load(maskpath)
+        _landsea_mask = np.unpackbits(bits, axis = 1, count = OISST_SHAPE[1]).astype(bool)
+
+    return _landsea_mask
 
 def onsea(lat, lon):
     """
-    Check if coordinates are on sea by reading value from OISST. 
-    If no value is available that means coordinates are on land.
-    Uses file from day before yesterday to definetly get file.
+    Check if coordinates are on sea with the land/sea mask of OISST. 
+    Works for single coordinates and for arrays of coordinates, e.g. a whole route.
     """
-    day_before_yesterday = date.today() - timedelta(days = 10) 
-    sst, _ = OISSTFile(day_before_yesterday).sea_surface_temperature(lat, lon)
+    index_lat, index_lon = grid_indices(lat, lon)
+    result = landsea_mask()[index_lat, index_lon]
 
-    if isinstance(sst, np.float32):
-        return True
-    else:
-        return False
+    if np.ndim(result) == 0:
+        return bool(result)
+    return result
 
 def clear():
-    """Delete all downloaded weatherdata"""
-    shutil.rmtree(WEATHERDATAPATH)
\ No newline at end of file
+    """Delete all downloaded weatherdata from the cache"""
+    with _oisst_files_lock:
+        _oisst_files.clear()
+    with _station_years_lock:
+        _station_years.clear()
+    for source in ['isd-lite', 'oisst', 'icoads']:
+        cache.clear(source)
\ No newline at end of file